@@ -0,0 +1,662 @@
+"""
+Helpers shared by the plugins of this repository.
+
+Install it like any other plugin (plugins add Jees1/v_test/common) before the plugins that use it.
+They import it from the plugin folder next to their own, which modmail names after the plugin and
+the branch it was installed from, like plugins/Jees1/v_test/common-master.
+"""
+
+import asyncio
+import heapq
+import json
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import discord
+from discord.ext import commands
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+# Cooldowns are kept in this SQLite file when it is set, so every bot process and shard shares them
+COOLDOWN_DB = os.environ.get("COOLDOWN_DB")
+# Sessions are kept in this SQLite file instead of the plugin database when it is set
+SESSION_DB = os.environ.get("SESSION_DB")
+# Seconds between removing expired cooldowns
+COOLDOWN_SWEEP_INTERVAL = 300
+
+# Edits to the same message within this many seconds of the last one sent are merged into one
+EDIT_WINDOW = 1.0
+
+# Announcements, edits and deletions running at once when a session is sent to every guild
+FANOUT_CONCURRENCY = 5
+
+
+class SQLiteFile:
+    """
+    A SQLite connection in WAL mode that is only used from its own thread. Waiting for a write lock
+    held by another process blocks that thread, never the event loop.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.db = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def call(self, fn, *args):
+        if self.db is None:
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=5, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.schema)
+            self.db = db
+        return fn(self.db, *args)
+
+    async def run(self, fn, *args):
+        """Runs fn(connection, *args) on the connection's thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.call, fn, *args)
+
+    def close(self):
+        self.executor.submit(lambda: self.db is not None and self.db.close())
+        self.executor.shutdown(wait=False)
+
+
+class MemoryCooldowns:
+    """
+    Per-user command cooldowns kept in process memory, used unless COOLDOWN_DB is set.
+    """
+
+    def __init__(self):
+        self.expires = {}  # "command:user id" -> time the cooldown ends
+        self.next_sweep = 0
+
+    async def acquire(self, key, per):
+        """Starts the cooldown if it isn't running, returns the seconds left on it otherwise."""
+        now = time.time()
+        if now >= self.next_sweep:
+            self.next_sweep = now + COOLDOWN_SWEEP_INTERVAL
+            await self.sweep(now)
+        until = self.expires.get(key, 0)
+        if until > now:
+            return until - now
+        running = await self.claim(key, per, now)
+        self.expires[key] = running or now + per
+        return running - now if running else 0
+
+    async def claim(self, key, per, now):
+        """Returns when the cooldown ends if another process is already running it."""
+        return None
+
+    async def sweep(self, now):
+        self.expires = {k: v for k, v in self.expires.items() if v > now}
+
+    def close(self):
+        pass
+
+
+class SQLiteCooldowns(MemoryCooldowns):
+    """
+    Cooldowns shared by every process using the same SQLite file. A cooldown that is known to be
+    running is answered from memory, only free ones are claimed in the database with a single upsert.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.db = SQLiteFile(path, "CREATE TABLE IF NOT EXISTS cooldowns (key TEXT PRIMARY KEY, until REAL NOT NULL) WITHOUT ROWID;")
+
+    @staticmethod
+    def claim_row(db, key, per, now):
+        # Only overwrites an expired cooldown, so two processes can't both claim the same one
+        cur = db.execute(
+            "INSERT INTO cooldowns (key, until) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET until = excluded.until WHERE cooldowns.until <= ?",
+            (key, now + per, now)
+        )
+        if cur.rowcount:
+            return None
+        return db.execute("SELECT until FROM cooldowns WHERE key = ?", (key,)).fetchone()[0]
+
+    async def claim(self, key, per, now):
+        return await self.db.run(self.claim_row, key, per, now)
+
+    async def sweep(self, now):
+        await super().sweep(now)
+        await self.db.run(lambda db: db.execute("DELETE FROM cooldowns WHERE cooldowns.until <= ?", (now,)))
+
+    def close(self):
+        self.db.close()
+
+
+def cooldown_backend():
+    return SQLiteCooldowns(COOLDOWN_DB) if COOLDOWN_DB else MemoryCooldowns()
+
+
+def shared_cooldown(per):
+    """
+    Like commands.cooldown(1, per, BucketType.user), but kept in the cog's cooldown backend.
+    The cooldown is claimed right before the command runs, so running its checks, like the help
+    command does, doesn't start it.
+    """
+    async def claim(cog, ctx):
+        retry_after = await cog.cooldowns.acquire(f"{ctx.command.qualified_name}:{ctx.author.id}", per)
+        if retry_after:
+            raise commands.CommandOnCooldown(commands.Cooldown(1, per), retry_after, commands.BucketType.user)
+    return commands.before_invoke(claim)
+
+
+class EmbedTemplates:
+    """
+    Embeds that only depend on the guild and theme color, built once per (name, guild, color).
+    get() hands out shallow copies that share everything with the template but the field list.
+    Fields given in values get a new dict, the others are still shared and must not be edited in place.
+    template() returns the shared embed itself, for embeds that are sent unchanged.
+    """
+
+    def __init__(self):
+        self.builders = {}  # name -> builder(guild id, color)
+        self.cache = {}  # (name, guild id, color) -> (discord.Embed, its attributes)
+
+    def register(self, name, builder):
+        self.builders[name] = builder
+
+    def entry(self, name, guild_id, color):
+        key = (name, guild_id, color)
+        entry = self.cache.get(key)
+        if entry is None:
+            embed = self.builders[name](guild_id, color)
+            names = [x for klass in type(embed).__mro__ for x in getattr(klass, "__slots__", ())]
+            names += list(getattr(embed, "__dict__", ()))
+            entry = self.cache[key] = (embed, tuple((x, getattr(embed, x)) for x in names if hasattr(embed, x)))
+        return entry
+
+    def template(self, name, guild_id=None, color=None):
+        return self.entry(name, guild_id, color)[0]
+
+    def get(self, name, guild_id=None, color=None, values=None, **attrs):
+        template, state = self.entry(name, guild_id, color)
+        embed = object.__new__(type(template))
+        for attr, value in state:
+            setattr(embed, attr, value)
+        fields = getattr(template, "_fields", None)
+        if fields is not None:
+            embed._fields = list(fields)
+            for index, value in (values or {}).items():
+                embed._fields[index] = {**fields[index], "value": value}
+        for attr, value in attrs.items():
+            setattr(embed, attr, value)
+        return embed
+
+    def invalidate(self, guild_id):
+        self.cache = {k: v for k, v in self.cache.items() if k[1] != guild_id}
+
+
+def render_only(view):
+    """
+    Stops a persistent view so it only renders its components. Clicks are handled by the
+    instance the cog registered with bot.add_view, including on messages sent before a restart.
+    """
+    view.stop()
+    return view
+
+
+class FanOut:
+    """
+    Runs one API call per target channel with bounded concurrency.
+    Calls to the same channel never overlap and wait out a channel's rate limit before retrying it.
+    """
+
+    def __init__(self, limit=FANOUT_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.channel_locks = defaultdict(asyncio.Lock)
+        self.retry_at = {}  # channel id -> monotonic time the channel can be used again
+
+    async def run(self, channel_id, call):
+        async with self.channel_locks[channel_id]:
+            wait = self.retry_at.get(channel_id, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self.semaphore:
+                try:
+                    return await call()
+                except discord.RateLimited as e:
+                    self.retry_at[channel_id] = time.monotonic() + e.retry_after
+                    raise
+                except discord.HTTPException as e:
+                    if e.status == 429:
+                        self.retry_at[channel_id] = time.monotonic() + 5
+                    raise
+
+    async def gather(self, jobs):
+        """Runs (channel id, call) jobs and returns their results in order, exceptions included."""
+        return await asyncio.gather(*(self.run(channel_id, call) for channel_id, call in jobs), return_exceptions=True)
+
+
+class EditCoalescer:
+    """
+    Sends the first edit to a message right away, edits made while it is in flight or within
+    EDIT_WINDOW seconds after it are merged and only the latest value of every field is sent.
+    Every caller waits for, and gets the result of, the edit its fields went out with.
+    """
+
+    def __init__(self, fanout=None, window=EDIT_WINDOW):
+        self.fanout = fanout
+        self.window = window
+        self.queued = {}  # message id -> (fields, future) of the next edit
+        self.tasks = {}  # message id -> task sending the queued edits
+
+    async def edit(self, message, **fields):
+        queued = self.queued.get(message.id)
+        if queued is None:
+            queued = self.queued[message.id] = ({}, asyncio.get_running_loop().create_future())
+            if message.id not in self.tasks:
+                self.tasks[message.id] = asyncio.create_task(self.drain(message))
+        queued[0].update(fields)
+        return await asyncio.shield(queued[1])
+
+    async def drain(self, message):
+        try:
+            while message.id in self.queued:
+                fields, future = self.queued.pop(message.id)
+                try:
+                    if self.fanout is not None:
+                        result = await self.fanout.run(message.channel.id, lambda: message.edit(**fields))
+                    else:
+                        result = await message.edit(**fields)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                await asyncio.sleep(self.window)
+        finally:
+            del self.tasks[message.id]
+
+
+class MongoSessions:
+    """
+    Session documents in the plugin partition, shared by every process using the same database.
+    Updates are optimistic: they name the version they read and fail if the session was written since.
+    """
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    async def create_indexes(self):
+        # Clicks look sessions up by any copy's message ID and the expiry loops by expiry time,
+        # neither may scan the history and rollups kept in the same partition
+        await self.coll.create_index("message_ids")
+        await self.coll.create_index("expires_at", sparse=True)
+        await self.coll.create_index("scheduled_at", sparse=True)
+
+    def fork(self):
+        """Returns a store another worker can use, the database client already runs requests concurrently."""
+        return self
+
+    def close(self):
+        pass
+
+    async def insert(self, doc):
+        await self.coll.insert_one({**doc, "version": 0})
+
+    async def get(self, session_id):
+        return await self.coll.find_one({"_id": session_id})
+
+    async def find(self, message_id):
+        """Returns the session any copy of the announcement belongs to."""
+        return await self.coll.find_one({"$or": [{"_id": f"session:{message_id}"}, {"message_ids": message_id}]})
+
+    async def upcoming(self, now, limit=10):
+        """Returns the sessions scheduled from now on, soonest first."""
+        return [doc async for doc in self.coll.find({"scheduled_at": {"$gte": now}}).sort("scheduled_at", 1).limit(limit)]
+
+    async def all(self):
+        return [doc async for doc in self.coll.find({"expires_at": {"$exists": True}})]
+
+    async def expired(self, now):
+        return [doc async for doc in self.coll.find({"expires_at": {"$lte": now}})]
+
+    async def update(self, doc, fields):
+        """Returns the updated session, or None if it was changed or removed since doc was read."""
+        # Sessions stored before versioning have no version field, which None matches
+        return await self.coll.find_one_and_update(
+            {"_id": doc["_id"], "version": doc.get("version")},
+            {"$set": fields, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def delete(self, session_id):
+        """Removes the session and returns it, only one caller gets it back."""
+        return await self.coll.find_one_and_delete({"_id": session_id})
+
+    async def claim_slot(self, key, until):
+        """
+        Holds the slot named key until the given unix time, returns False if it is already held.
+        A slot whose holder didn't release it in time can be claimed again.
+        """
+        try:
+            # A held slot doesn't match, so the upsert collides with its _id
+            await self.coll.update_one(
+                {"_id": key, "until": {"$lt": int(time.time())}},
+                {"$set": {"until": until}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_slot(self, key):
+        await self.coll.delete_one({"_id": key})
+
+
+class SQLiteSessions:
+    """
+    The same sessions kept in a SQLite file in WAL mode, for bot processes that share a host.
+    Every plugin keeps its sessions in tables of its own, named after kind.
+    """
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.sessions = f"{kind}_sessions"
+        self.messages = f"{kind}_session_messages"
+        self.slots = f"{kind}_slots"
+        self.db = SQLiteFile(path, f"""
+            CREATE TABLE IF NOT EXISTS {self.sessions} (id TEXT PRIMARY KEY, version INTEGER NOT NULL, expires_at INTEGER NOT NULL, data TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS {self.sessions}_expires_at ON {self.sessions} (expires_at);
+            CREATE TABLE IF NOT EXISTS {self.messages} (message_id INTEGER PRIMARY KEY, session_id TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS {self.slots} (key TEXT PRIMARY KEY, until INTEGER NOT NULL);
+        """)
+
+    async def create_indexes(self):
+        pass
+
+    def fork(self):
+        """Returns a store on a connection of its own, like another bot process would have."""
+        return SQLiteSessions(self.path, self.kind)
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def load(row):
+        if row is None:
+            return None
+        doc = json.loads(row[1])
+        doc["version"] = row[0]
+        return doc
+
+    async def select(self, where, args):
+        rows = await self.db.run(lambda db: db.execute(f"SELECT version, data FROM {self.sessions} WHERE {where}", args).fetchall())
+        return [self.load(row) for row in rows]
+
+    def insert_rows(self, db, doc):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                f"INSERT INTO {self.sessions} (id, version, expires_at, data) VALUES (?, 0, ?, ?)",
+                (doc["_id"], doc["expires_at"], json.dumps(doc))
+            )
+            db.executemany(
+                f"INSERT OR REPLACE INTO {self.messages} (message_id, session_id) VALUES (?, ?)",
+                [(message_id, doc["_id"]) for message_id in doc.get("message_ids", [doc["message_id"]])]
+            )
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    async def insert(self, doc):
+        await self.db.run(self.insert_rows, doc)
+
+    def get_row(self, db, session_id):
+        return db.execute(f"SELECT version, data FROM {self.sessions} WHERE id = ?", (session_id,)).fetchone()
+
+    async def get(self, session_id):
+        return self.load(await self.db.run(self.get_row, session_id))
+
+    def find_row(self, db, message_id):
+        row = db.execute(f"SELECT session_id FROM {self.messages} WHERE message_id = ?", (message_id,)).fetchone()
+        return self.get_row(db, row[0] if row else f"session:{message_id}")
+
+    async def find(self, message_id):
+        return self.load(await self.db.run(self.find_row, message_id))
+
+    async def upcoming(self, now, limit=10):
+        """Returns the sessions scheduled from now on, soonest first."""
+        return await self.select(
+            "json_extract(data, '$.scheduled_at') >= ? ORDER BY json_extract(data, '$.scheduled_at') LIMIT ?",
+            (now, limit)
+        )
+
+    async def all(self):
+        return await self.select("1", ())
+
+    async def expired(self, now):
+        return await self.select("expires_at <= ?", (now,))
+
+    def update_row(self, db, doc, updated):
+        return db.execute(
+            f"UPDATE {self.sessions} SET version = version + 1, expires_at = ?, data = ? WHERE id = ? AND version = ?",
+            (updated["expires_at"], json.dumps(updated), doc["_id"], doc["version"])
+        ).rowcount
+
+    async def update(self, doc, fields):
+        """Returns the updated session, or None if it was changed or removed since doc was read."""
+        updated = {k: v for k, v in doc.items() if k != "version"}
+        updated.update(fields)
+        if not await self.db.run(self.update_row, doc, updated):
+            return None
+        updated["version"] = doc["version"] + 1
+        return updated
+
+    def delete_rows(self, db, session_id):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.get_row(db, session_id)
+            if row is not None:
+                db.execute(f"DELETE FROM {self.sessions} WHERE id = ?", (session_id,))
+                db.execute(f"DELETE FROM {self.messages} WHERE session_id = ?", (session_id,))
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return row
+
+    async def delete(self, session_id):
+        """Removes the session and returns it, only one caller gets it back."""
+        return self.load(await self.db.run(self.delete_rows, session_id))
+
+    def claim_row(self, db, key, until):
+        return db.execute(
+            f"INSERT INTO {self.slots} (key, until) VALUES (?, ?) "
+            f"ON CONFLICT (key) DO UPDATE SET until = excluded.until WHERE {self.slots}.until < ?",
+            (key, until, int(time.time()))
+        ).rowcount
+
+    async def claim_slot(self, key, until):
+        """
+        Holds the slot named key until the given unix time, returns False if it is already held.
+        A slot whose holder didn't release it in time can be claimed again.
+        """
+        return bool(await self.db.run(self.claim_row, key, until))
+
+    async def release_slot(self, key):
+        await self.db.run(lambda db: db.execute(f"DELETE FROM {self.slots} WHERE key = ?", (key,)))
+
+
+def session_backend(coll, kind):
+    return SQLiteSessions(SESSION_DB, kind) if SESSION_DB else MongoSessions(coll)
+
+
+class DeletionScheduler:
+    """
+    Deletes messages once they are due from a single wakeup loop.
+    Pending deletions are kept in the plugin partition so they survive restarts.
+    """
+
+    def __init__(self, bot, coll):
+        self.bot = bot
+        self.coll = coll
+        self.heap = []
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    async def start(self):
+        async for job in self.coll.find({"delete_at": {"$exists": True}}):
+            self.heap.append((job["delete_at"], job["channel_id"], job["message_id"]))
+        heapq.heapify(self.heap)
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def schedule(self, channel_id, message_id, delete_at):
+        await self.coll.update_one(
+            {"_id": f"delete:{message_id}"},
+            {"$set": {"channel_id": channel_id, "message_id": message_id, "delete_at": delete_at}},
+            upsert=True
+        )
+        heapq.heappush(self.heap, (delete_at, channel_id, message_id))
+        self.wakeup.set()
+
+    async def run(self):
+        # Deletions that came due while the bot was down are picked up on the first pass
+        await self.bot.wait_until_ready()
+        while True:
+            now = datetime.now(timezone.utc).timestamp()
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap))
+            if due:
+                try:
+                    await self.delete_due(due)
+                except Exception as e:
+                    print(f"Failed to run {len(due)} deletions: {e}")
+                continue
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.heap[0][0] - now if self.heap else None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def delete_due(self, due):
+        by_channel = {}
+        for _, channel_id, message_id in due:
+            by_channel.setdefault(channel_id, []).append(message_id)
+
+        # Channels are independent rate limit buckets, so they are cleared in parallel
+        await asyncio.gather(*(self.delete_channel(channel_id, message_ids) for channel_id, message_ids in by_channel.items()))
+        await self.coll.delete_many({"_id": {"$in": [f"delete:{message_id}" for _, _, message_id in due]}})
+
+    async def delete_channel(self, channel_id, message_ids):
+        channel = self.bot.get_channel(channel_id)
+        if not channel:
+            print(f"Channel {channel_id} could not be found, dropping {len(message_ids)} deletions.")
+            return
+        for i in range(0, len(message_ids), 100):
+            chunk = message_ids[i:i + 100]
+            try:
+                if len(chunk) == 1:
+                    await channel.get_partial_message(chunk[0]).delete()
+                else:
+                    await channel.delete_messages([discord.Object(id=x) for x in chunk])
+            except discord.NotFound:
+                pass
+            except discord.HTTPException:
+                # Bulk deletes need manage messages and messages younger than 14 days
+                for message_id in chunk:
+                    try:
+                        await channel.get_partial_message(message_id).delete()
+                    except discord.HTTPException as e:
+                        print(f"Failed to delete message {message_id}: {e}")
+
+
+class PermissionResolver:
+    """
+    Resolves a member's capabilities from the per-guild role lists.
+    Role lists are kept as frozensets and each member's capabilities are cached as a bitmask
+    until their roles or the guild's configuration change.
+    """
+
+    def __init__(self, defaults):
+        self.defaults = {cap: frozenset(roles) for cap, roles in defaults.items()}
+        self.guild_roles = {}  # guild id -> {capability: frozenset of role ids}
+        self.cache = {}  # (guild id, member id) -> capability bitmask
+
+    def roles_for(self, guild_id):
+        return self.guild_roles.get(guild_id, self.defaults)
+
+    def set_roles(self, guild_id, cap, roles):
+        guild_roles = dict(self.roles_for(guild_id))
+        guild_roles[cap] = frozenset(roles)
+        self.guild_roles[guild_id] = guild_roles
+        self.invalidate(guild_id)
+
+    def capabilities(self, member):
+        guild = getattr(member, "guild", None)
+        if guild is None:
+            return 0
+        key = (guild.id, member.id)
+        caps = self.cache.get(key)
+        if caps is None:
+            role_ids = {role.id for role in member.roles}
+            caps = 0
+            for cap, allowed in self.roles_for(guild.id).items():
+                if not allowed.isdisjoint(role_ids):
+                    caps |= cap
+            self.cache[key] = caps
+        return caps
+
+    def invalidate(self, guild_id, member_id=None):
+        if member_id is not None:
+            self.cache.pop((guild_id, member_id), None)
+        else:
+            self.cache = {k: v for k, v in self.cache.items() if k[0] != guild_id}
+
+
+def rollup_periods(timestamp):
+    """Returns the all time, daily and weekly rollup periods a timestamp falls in."""
+    day = datetime.fromtimestamp(timestamp, timezone.utc)
+    year, week, _ = day.isocalendar()
+    return ("all", f"day:{day:%Y-%m-%d}", f"week:{year}-W{week:02d}")
+
+
+def format_duration(seconds):
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f"{hours}h {minutes}m"
+
+
+async def record_history(coll, session_id, guild_id, host_id, started_at, ended_at, ended_by):
+    """Appends a finished session to the history and adds it to the host's and guild's daily, weekly and all time rollups."""
+    await coll.insert_one({
+        "_id": f"history:{session_id}",
+        "guild_id": guild_id,
+        "host_id": host_id,
+        "start": started_at,
+        "end": ended_at,
+        "ended_by": ended_by
+    })
+    duration = max(0, ended_at - started_at) if started_at else 0
+    ops = [
+        UpdateOne({"_id": f"rollup:{guild_id}:{subject}:{period}"}, {"$inc": {"count": 1, "seconds": duration}}, upsert=True)
+        for subject in (host_id, "guild")
+        for period in rollup_periods(ended_at)
+    ]
+    await coll.bulk_write(ops, ordered=False)
+
+
+async def rollup_stats(coll, guild_id, subject):
+    """Returns the all time, today and this week rollups of a host, or of the whole guild."""
+    ids = [f"rollup:{guild_id}:{subject}:{period}" for period in rollup_periods(int(datetime.now(timezone.utc).timestamp()))]
+    docs = {}
+    async for doc in coll.find({"_id": {"$in": ids}}):
+        docs[doc["_id"]] = doc
+    return [docs.get(x, {}) for x in ids]
+
+
+async def setup(bot):
+    # Nothing to register, the other plugins import this module directly
+    pass
@@ -1,9 +1,106 @@
+import asyncio
+import random
+import re
+import string
+import time
+from collections import Counter, defaultdict, deque, namedtuple
+from importlib import import_module
+from types import SimpleNamespace
+
 import discord
 from discord.ext import commands
 
 from core import checks
 from core.models import PermissionLevel
 
+# Helpers shared with the other plugins, from the "common" plugin installed next to this one
+common = import_module(f"..{__package__.rpartition('.')[2].replace('detect', 'common', 1)}.common", __package__)
+
+CHAIRMAN_ID = 497582356064894997
+
+# Used for every guild that has not configured its own protected users.
+DEFAULT_PROTECTED = frozenset({CHAIRMAN_ID})
+
+WARNING_TEXT = "Please do not ping the Chairman. If you need assistance, direct it to one of the Chairman's assistants or DM @Vinns Support."
+REPLY_GIF = "https://cdn.discordapp.com/attachments/633681171879952384/830772052045725716/aaaaa.gif"
+
+# At most PING_BURST warnings are sent per channel every PING_WINDOW seconds,
+# anything above that is folded into a single warning once the window frees up.
+PING_WINDOW = 60
+PING_BURST = 3
+
+# kind is "ping" (value is the protected user's ID, for aliases) or "phrase" (value is the banned phrase)
+Rule = namedtuple("Rule", "kind value")
+
+
+class RuleAutomaton:
+    """
+    Aho-Corasick automaton over every rule of a guild, so a message is matched in a single
+    pass over its content no matter how many rules there are.
+    """
+
+    __slots__ = ("goto", "fail", "out", "prefilter")
+
+    def __init__(self, rules):
+        # rules: lowercase pattern -> Rule
+        goto = [{}]
+        out = [[]]
+        for pattern, rule in rules.items():
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = goto[node][ch] = len(goto)
+                    goto.append({})
+                    out.append([])
+                node = nxt
+            out[node].append((len(pattern), rule))
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+        self.goto = goto
+        self.fail = fail
+        self.out = out
+        # Finds whether any rule occurs at all with the re module's C loop. Most messages contain
+        # none, so they never reach the per-character loop of search.
+        self.prefilter = re.compile("|".join(map(re.escape, rules)))
+
+    def search(self, text):
+        """Yields (start, end, rule) for every rule found in text."""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for length, rule in out[node]:
+                    yield i + 1 - length, i + 1, rule
+
+
+def reply_warning(guild_id, color):
+    replyMsg = discord.Embed(
+        description=f"{WARNING_TEXT}\n\nRemember to turn off reply mentions:",
+        color=color
+    )
+    replyMsg.set_image(url=REPLY_GIF)
+    return replyMsg
+
+
+def is_word_match(text, start, end):
+    """Only whole words count, so an alias doesn't match inside a longer word."""
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
 class botPing(commands.Cog):
     """
     Don't ping the chairman!!
@@ -11,27 +108,426 @@ class botPing(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-    
+        self.coll = bot.plugin_db.get_partition(self)
+        self.protected_users = {}
+        self.ping_aliases = {}  # guild id -> {alias: protected user id}
+        self.banned_phrases = {}  # guild id -> frozenset of phrases
+        self.phrase_logs = {}  # guild id -> channel id messages with a banned phrase are posted in
+        self.phrase_deletes = set()  # ids of the guilds that opted into deleting those messages
+        self.automata = {}  # guild id -> RuleAutomaton, only for guilds with aliases or banned phrases
+        self.ping_throttle = {}
+        self.ping_stats = defaultdict(Counter)
+        self.templates = common.EmbedTemplates()
+        self.templates.register("warning", lambda guild_id, color: discord.Embed(description=WARNING_TEXT, color=color))
+        self.templates.register("reply_warning", reply_warning)
+        self._sent = defaultdict(deque)  # channel id -> warning timestamps inside the window
+        self._warned = {}  # (channel id, author id) -> last warning timestamp
+        self._pending = {}  # channel id -> {author id: pinged in content}
+        self._flushes = set()  # tasks sending the coalesced warnings, kept so they aren't collected or left behind
+
+    async def cog_load(self):
+        async for doc in self.coll.find({}):
+            guild_id = int(doc["_id"])
+            if "protected_users" in doc:
+                self.protected_users[guild_id] = frozenset(doc["protected_users"])
+            if "ping_aliases" in doc:
+                self.ping_aliases[guild_id] = {alias: int(user) for alias, user in doc["ping_aliases"].items()}
+            if "banned_phrases" in doc:
+                self.banned_phrases[guild_id] = frozenset(doc["banned_phrases"])
+            if doc.get("phrase_log"):
+                self.phrase_logs[guild_id] = doc["phrase_log"]
+            if doc.get("phrase_delete"):
+                self.phrase_deletes.add(guild_id)
+            if "ping_window" in doc:
+                self.ping_throttle[guild_id] = (doc["ping_window"], doc["ping_burst"])
+        for guild_id in self.ping_aliases.keys() | self.banned_phrases.keys():
+            self.rules_changed(guild_id)
+
+    def cog_unload(self):
+        for task in self._flushes:
+            task.cancel()
+
+    def warning_embeds(self):
+        """Returns the (no reply, reply) warning embeds, built once per theme color."""
+        # Warnings are sent unchanged, so the templates themselves are used instead of copies
+        color = self.bot.main_color
+        return self.templates.template("warning", color=color), self.templates.template("reply_warning", color=color)
+
+    def compile_rules(self, guild_id):
+        """Returns the automaton over the guild's aliases and banned phrases, None if it has neither."""
+        # Mentions of protected users are found through raw_mentions, they need no rules
+        rules = {}
+        for alias, user_id in self.ping_aliases.get(guild_id, {}).items():
+            rules[alias] = Rule("ping", user_id)
+        for phrase in self.banned_phrases.get(guild_id, ()):
+            rules[phrase] = Rule("phrase", phrase)
+        return RuleAutomaton(rules) if rules else None
+
+    def rules_changed(self, guild_id):
+        # Rebuilt right away by whatever changed the rules and swapped in whole,
+        # so no message ever waits for a build or sees a half built automaton
+        automaton = self.compile_rules(guild_id)
+        if automaton is None:
+            self.automata.pop(guild_id, None)
+        else:
+            self.automata[guild_id] = automaton
+
+    def scan(self, message):
+        """
+        Returns (hit, phrase). hit is True if a protected user is pinged or named in the
+        message content, False if they are only pinged through a reply and None otherwise.
+        phrase is the first banned phrase in the message, if there is one.
+        """
+        guild = message.guild
+        guild_id = guild.id if guild else None
+        protected = self.protected_users.get(guild_id, DEFAULT_PROTECTED)
+        hit = True if protected and not protected.isdisjoint(message.raw_mentions) else None
+        automaton = self.automata.get(guild_id)
+        if automaton is not None and message.content:
+            text = message.content.lower()
+            if automaton.prefilter.search(text) is not None:
+                for start, end, rule in automaton.search(text):
+                    if not is_word_match(text, start, end):
+                        continue
+                    if rule.kind == "phrase":
+                        return hit, rule.value
+                    hit = True
+        if hit is None and message.reference is not None:
+            # Reply pings never show up in the content, only replies need the resolved mentions.
+            for member in message.mentions:
+                if member.id in protected:
+                    return False, None
+        return hit, None
+
     @commands.Cog.listener()
     async def on_message(self, message):
-      for x in message.mentions:
-        if x.id == 497582356064894997:
-          replyMsg = discord.Embed(
-            description = "Please do not ping the Chairman. If you need assistance, direct it to one of the Chairman's assistants or DM @Vinns Support.\n\nRemember to turn off reply mentions:",
-            color = self.bot.main_color
-          )
-          replyMsg.set_image(url="https://cdn.discordapp.com/attachments/633681171879952384/830772052045725716/aaaaa.gif")
-
-          noReplyMsg = discord.Embed(
-            description = "Please do not ping the Chairman. If you need assistance, direct it to one of the Chairman's assistants or DM @Vinns Support.",
-            color = self.bot.main_color,
-          )
-          if "497582356064894997" in message.content:
-           await message.channel.send(content=f"<@!{message.author.id}>", embed=noReplyMsg)
-          else:
-           await message.channel.send(content=f"<@!{message.author.id}>", embed=replyMsg)
-          break
-           
-
-def setup(bot):
-    bot.add_cog(botPing(bot))
+        if message.author.bot:
+            return
+        hit, phrase = self.scan(message)
+        guild_id = message.guild.id if message.guild else None
+        if phrase is not None:
+            await self.flag_phrase(message, guild_id, phrase)
+            return
+        if hit is None:
+            return
+        window, burst = self.ping_throttle.get(guild_id, (PING_WINDOW, PING_BURST))
+        stats = self.ping_stats[guild_id]
+        channel_id = message.channel.id
+        now = time.monotonic()
+
+        key = (channel_id, message.author.id)
+        last = self._warned.get(key)
+        if last is not None and now - last < window:
+            stats["suppressed"] += 1
+            return
+        self._warned[key] = now
+        if len(self._warned) > 4096:
+            self._warned = {k: v for k, v in self._warned.items() if now - v < window}
+
+        pending = self._pending.get(channel_id)
+        if pending is not None:
+            pending[message.author.id] = pending.get(message.author.id, True) and hit
+            stats["coalesced"] += 1
+            return
+
+        sent = self._sent[channel_id]
+        while sent and now - sent[0] >= window:
+            sent.popleft()
+        if len(sent) < burst:
+            sent.append(now)
+            stats["sent"] += 1
+            noReplyMsg, replyMsg = self.warning_embeds()
+            await message.channel.send(content=f"<@!{message.author.id}>", embed=noReplyMsg if hit else replyMsg)
+            return
+
+        self._pending[channel_id] = {message.author.id: hit}
+        stats["coalesced"] += 1
+        task = asyncio.create_task(self.flush_pings(message.channel, guild_id, window - (now - sent[0])))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush_pings(self, channel, guild_id, delay):
+        """Sends one warning for everyone who pinged a protected user while the channel was throttled."""
+        await asyncio.sleep(delay)
+        pending = self._pending.pop(channel.id, None)
+        if not pending:
+            return
+        self._sent[channel.id].append(time.monotonic())
+        self.ping_stats[guild_id]["sent"] += 1
+        noReplyMsg, replyMsg = self.warning_embeds()
+        try:
+            await channel.send(
+                content=" ".join(f"<@!{x}>" for x in pending),
+                embed=noReplyMsg if all(pending.values()) else replyMsg
+            )
+        except discord.HTTPException as e:
+            print(f"Failed to send the coalesced ping warning: {e}")
+
+    async def flag_phrase(self, message, guild_id, phrase):
+        """
+        Counts a message with a banned phrase and posts it to the guild's log channel.
+        It is only deleted in guilds that opted in, and never when staff sent it.
+        """
+        stats = self.ping_stats[guild_id]
+        stats["flagged"] += 1
+        permissions = getattr(message.author, "guild_permissions", None)
+        deleted = False
+        if guild_id in self.phrase_deletes and not (permissions and permissions.manage_messages):
+            try:
+                await message.delete()
+                deleted = True
+                stats["deleted"] += 1
+            except discord.HTTPException as e:
+                print(f"Failed to delete a message with a banned phrase: {e}")
+
+        log = self.bot.get_channel(self.phrase_logs[guild_id]) if guild_id in self.phrase_logs else None
+        if log is None:
+            return
+        embed = discord.Embed(
+            description=f"{message.author.mention} used the banned phrase `{phrase}` in {message.channel.mention}.",
+            color=15158332 if deleted else self.bot.main_color
+        )
+        embed.add_field(name="Message", value=message.content[:1024], inline=False)
+        embed.set_footer(text="The message was deleted." if deleted else f"Message ID: {message.id}")
+        if not deleted:
+            embed.add_field(name="Jump", value=f"[Go to message](https://discord.com/channels/{guild_id}/{message.channel.id}/{message.id})")
+        try:
+            await log.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+        except discord.HTTPException as e:
+            print(f"Failed to log a message with a banned phrase: {e}")
+
+    async def save_protected(self, guild_id, users):
+        self.protected_users[guild_id] = frozenset(users)
+        await self.coll.update_one(
+            {"_id": str(guild_id)},
+            {"$set": {"protected_users": list(users)}},
+            upsert=True
+        )
+
+    async def save_aliases(self, guild_id, aliases):
+        self.ping_aliases[guild_id] = aliases
+        self.rules_changed(guild_id)
+        await self.coll.update_one(
+            {"_id": str(guild_id)},
+            {"$set": {"ping_aliases": {alias: str(user) for alias, user in aliases.items()}}},
+            upsert=True
+        )
+
+    async def save_phrases(self, guild_id, phrases):
+        self.banned_phrases[guild_id] = frozenset(phrases)
+        self.rules_changed(guild_id)
+        await self.coll.update_one(
+            {"_id": str(guild_id)},
+            {"$set": {"banned_phrases": sorted(phrases)}},
+            upsert=True
+        )
+
+    @commands.group(invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def pingprotect(self, ctx):
+        """
+        List the users members are warned for pinging.
+        """
+        users = self.protected_users.get(ctx.guild.id, DEFAULT_PROTECTED)
+        if not users:
+            return await ctx.send("No users are protected in this server.")
+        await ctx.send("Protected users: " + ", ".join(f"<@{x}>" for x in users), allowed_mentions=discord.AllowedMentions.none())
+
+    @pingprotect.command(name="add")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def pingprotect_add(self, ctx, member: discord.Member):
+        """
+        Warn members who ping this user.
+        """
+        users = self.protected_users.get(ctx.guild.id, DEFAULT_PROTECTED)
+        await self.save_protected(ctx.guild.id, users | {member.id})
+        await ctx.send(f"{member} is now protected from pings.")
+
+    @pingprotect.command(name="remove")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def pingprotect_remove(self, ctx, member: discord.Member):
+        """
+        Stop warning members who ping this user.
+        """
+        users = self.protected_users.get(ctx.guild.id, DEFAULT_PROTECTED)
+        await self.save_protected(ctx.guild.id, users - {member.id})
+        await ctx.send(f"{member} is no longer protected from pings.")
+
+    @pingprotect.command(name="alias")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def pingprotect_alias(self, ctx, member: discord.Member, *, alias: str.lower):
+        """
+        Treat a nickname or other name of a protected user like a ping.
+        """
+        aliases = dict(self.ping_aliases.get(ctx.guild.id, {}))
+        aliases[alias.strip()] = member.id
+        await self.save_aliases(ctx.guild.id, aliases)
+        await ctx.send(f"`{alias.strip()}` now counts as pinging {member}.")
+
+    @pingprotect.command(name="unalias")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def pingprotect_unalias(self, ctx, *, alias: str.lower):
+        """
+        Stop treating a name like a ping.
+        """
+        aliases = dict(self.ping_aliases.get(ctx.guild.id, {}))
+        if aliases.pop(alias.strip(), None) is None:
+            return await ctx.send(f"`{alias.strip()}` isn't an alias.")
+        await self.save_aliases(ctx.guild.id, aliases)
+        await ctx.send(f"`{alias.strip()}` no longer counts as a ping.")
+
+    @commands.group(invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def bannedphrase(self, ctx):
+        """
+        List the phrases whose messages are flagged.
+        """
+        phrases = self.banned_phrases.get(ctx.guild.id)
+        if not phrases:
+            return await ctx.send("No phrases are banned in this server.")
+        await ctx.send("Banned phrases: " + ", ".join(f"`{x}`" for x in sorted(phrases)))
+
+    @bannedphrase.command(name="add")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def bannedphrase_add(self, ctx, *, phrase: str.lower):
+        """
+        Flag messages containing this phrase.
+        """
+        await self.save_phrases(ctx.guild.id, self.banned_phrases.get(ctx.guild.id, frozenset()) | {phrase.strip()})
+        await ctx.send(f"`{phrase.strip()}` is now banned.")
+
+    @bannedphrase.command(name="remove")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def bannedphrase_remove(self, ctx, *, phrase: str.lower):
+        """
+        Stop flagging messages containing this phrase.
+        """
+        await self.save_phrases(ctx.guild.id, self.banned_phrases.get(ctx.guild.id, frozenset()) - {phrase.strip()})
+        await ctx.send(f"`{phrase.strip()}` is no longer banned.")
+
+    @bannedphrase.command(name="log")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def bannedphrase_log(self, ctx, channel: discord.TextChannel = None):
+        """
+        Post messages with a banned phrase in this channel, or stop posting them if no channel is given.
+        """
+        if channel is None:
+            self.phrase_logs.pop(ctx.guild.id, None)
+        else:
+            self.phrase_logs[ctx.guild.id] = channel.id
+        await self.coll.update_one(
+            {"_id": str(ctx.guild.id)},
+            {"$set": {"phrase_log": channel.id if channel else None}},
+            upsert=True
+        )
+        await ctx.send(f"Banned phrases are now logged in {channel.mention}." if channel else "Banned phrases are no longer logged.")
+
+    @bannedphrase.command(name="delete")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def bannedphrase_delete(self, ctx, enabled: bool):
+        """
+        Also delete messages with a banned phrase, unless staff sent them.
+        """
+        if enabled:
+            self.phrase_deletes.add(ctx.guild.id)
+        else:
+            self.phrase_deletes.discard(ctx.guild.id)
+        await self.coll.update_one(
+            {"_id": str(ctx.guild.id)},
+            {"$set": {"phrase_delete": enabled}},
+            upsert=True
+        )
+        await ctx.send("Messages with a banned phrase are now deleted." if enabled else "Messages with a banned phrase are no longer deleted.")
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def pingthrottle(self, ctx, window: int, burst: int):
+        """
+        Allow `burst` ping warnings per channel every `window` seconds.
+        """
+        if window < 1 or burst < 1:
+            return await ctx.send("The window and burst size must both be at least 1.")
+        self.ping_throttle[ctx.guild.id] = (window, burst)
+        await self.coll.update_one(
+            {"_id": str(ctx.guild.id)},
+            {"$set": {"ping_window": window, "ping_burst": burst}},
+            upsert=True
+        )
+        await ctx.send(f"Ping warnings are now limited to {burst} per channel every {window} seconds.")
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def pingstats(self, ctx):
+        """
+        Show how many ping warnings were sent, coalesced and suppressed.
+        """
+        stats = self.ping_stats[ctx.guild.id]
+        window, burst = self.ping_throttle.get(ctx.guild.id, (PING_WINDOW, PING_BURST))
+        await ctx.send(
+            f"**Sent:** {stats['sent']}\n**Coalesced:** {stats['coalesced']}\n**Suppressed:** {stats['suppressed']}\n"
+            f"**Banned phrases flagged:** {stats['flagged']} ({stats['deleted']} deleted)\n"
+            f"**Limit:** {burst} per channel every {window} seconds"
+        )
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def pingbench(self, ctx, iterations: int = 100000):
+        """
+        Measure the listener cost for messages that don't ping a protected user.
+        """
+        text = "Is anyone hosting a training later today? I missed the last one."
+        messages = [
+            SimpleNamespace(guild=ctx.guild, content=text, raw_mentions=[], reference=None, mentions=[]),
+            SimpleNamespace(guild=ctx.guild, content=f"{ctx.author.mention} {text}", raw_mentions=[ctx.author.id], reference=None, mentions=[ctx.author]),
+            SimpleNamespace(guild=ctx.guild, content=text, raw_mentions=[], reference=ctx.message, mentions=[ctx.author]),
+        ]
+        lines = []
+        for label, message in zip(("plain", "mention", "reply"), messages):
+            start = time.perf_counter_ns()
+            for _ in range(iterations):
+                self.scan(message)
+            lines.append(f"{label}: {(time.perf_counter_ns() - start) / iterations:.0f} ns/message")
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def rulebench(self, ctx, rules: int = 1000, iterations: int = 2000):
+        """
+        Measure compiling and matching with `rules` random phrases against a one rule scan per phrase.
+        """
+        rng = random.Random(0)
+        phrases = {"".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))) for _ in range(rules)}
+        text = " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(40))
+
+        start = time.perf_counter()
+        automaton = RuleAutomaton({x: Rule("phrase", x) for x in phrases})
+        compiled = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for _ in automaton.search(text):
+                pass
+        single_pass = (time.perf_counter() - start) / iterations
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            automaton.prefilter.search(text)
+        prefilter = (time.perf_counter() - start) / iterations
+
+        start = time.perf_counter()
+        for _ in range(max(1, iterations // 10)):
+            for phrase in phrases:
+                if phrase in text:
+                    pass
+        per_rule = (time.perf_counter() - start) / max(1, iterations // 10)
+
+        await ctx.send(
+            f"```\n{len(phrases)} rules, {len(automaton.goto)} states, compiled in {compiled * 1000:.1f}ms\n"
+            f"automaton: {single_pass * 1_000_000:.1f}us/message ({len(text) / single_pass / 1_000_000:.1f} MB/s)\n"
+            f"prefilter: {prefilter * 1_000_000:.1f}us/message\n"
+            f"scan per rule: {per_rule * 1_000_000:.1f}us/message\n```"
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(botPing(bot))
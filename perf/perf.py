@@ -0,0 +1,321 @@
+import gc
+import io
+import logging
+import sys
+import time
+from collections import Counter
+
+import discord
+import discord.webhook.async_
+from discord.ext import commands
+
+from core import checks
+from core.models import PermissionLevel
+
+# Every power of two is split in 2**SUB_BUCKET_BITS buckets, so a recorded
+# latency is off by at most ~6%, the same trade-off HDR histograms make.
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def allocations(make, iterations):
+    """Returns the memory blocks still allocated and the seconds taken per call of make."""
+    keep = []
+    gc.disable()
+    try:
+        before = sys.getallocatedblocks()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            keep.append(make())
+        elapsed = time.perf_counter() - start
+        blocks = sys.getallocatedblocks() - before
+    finally:
+        gc.enable()
+    return blocks / iterations, elapsed / iterations
+
+
+class Histogram:
+    """
+    Log-linear latency histogram, values are recorded in microseconds.
+    """
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket_of(value):
+        if value < SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+    @staticmethod
+    def upper_bound(bucket):
+        if bucket < SUB_BUCKETS:
+            return bucket
+        shift = bucket // SUB_BUCKETS - 1
+        return ((bucket % SUB_BUCKETS + SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = int(seconds * 1_000_000)
+        self.buckets[self.bucket_of(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the q-th quantile, in microseconds."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.upper_bound(bucket), self.max)
+        return self.max
+
+
+class RateLimitCounter(logging.Handler):
+    """
+    Counts the 429 warnings discord.py logs while it retries rate limited requests.
+    """
+
+    def __init__(self, counters):
+        super().__init__(logging.WARNING)
+        self.counters = counters
+
+    def emit(self, record):
+        if "rate limited" in record.getMessage():
+            self.counters[("rate_limited", record.name.rsplit(".", 1)[-1])] += 1
+
+
+class Perf(commands.Cog):
+    """
+    Latency histograms and API call counters for every command, interaction, request and attachment download.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.histograms = {}  # (kind, route) -> Histogram
+        self.counters = Counter()  # (name, label) -> count
+        self.rate_limits = RateLimitCounter(self.counters)
+        self._originals = {}
+
+    def record(self, kind, route, seconds):
+        histogram = self.histograms.get((kind, route))
+        if histogram is None:
+            histogram = self.histograms[(kind, route)] = Histogram()
+        histogram.record(seconds)
+
+    async def cog_load(self):
+        perf = self
+        http = self.bot.http
+        adapter = discord.webhook.async_.AsyncWebhookAdapter
+        view_task = discord.ui.View._scheduled_task
+        modal_task = discord.ui.Modal._scheduled_task
+        self._originals = {"http": http.request, "webhook": adapter.request, "view": view_task, "modal": modal_task}
+
+        async def request(route, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await perf._originals["http"](route, **kwargs)
+            except discord.HTTPException as e:
+                perf.counters[("http_errors", f"{route.method} {route.path} {e.status}")] += 1
+                raise
+            finally:
+                perf.record("http", f"{route.method} {route.path}", time.perf_counter() - start)
+
+        # Interaction responses and followups go through the webhook adapter instead of bot.http
+        async def webhook_request(adapter_self, route, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await perf._originals["webhook"](adapter_self, route, *args, **kwargs)
+            except discord.HTTPException as e:
+                perf.counters[("http_errors", f"{route.method} {route.path} {e.status}")] += 1
+                raise
+            finally:
+                perf.record("http", f"{route.method} {route.path}", time.perf_counter() - start)
+
+        async def timed_view_task(view, item, interaction, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await view_task(view, item, interaction, *args, **kwargs)
+            finally:
+                # Generated custom IDs are random, only persistent ones are stable enough to use as a route
+                name = item.custom_id if item.is_persistent() else getattr(item, "label", None) or type(item).__name__
+                perf.record("interaction", f"{type(view).__name__}.{name}", time.perf_counter() - start)
+
+        async def timed_modal_task(modal, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await modal_task(modal, *args, **kwargs)
+            finally:
+                perf.record("interaction", type(modal).__name__, time.perf_counter() - start)
+
+        http.request = request
+        adapter.request = webhook_request
+        discord.ui.View._scheduled_task = timed_view_task
+        discord.ui.Modal._scheduled_task = timed_modal_task
+        logging.getLogger("discord.http").addHandler(self.rate_limits)
+        logging.getLogger("discord.webhook.async_").addHandler(self.rate_limits)
+
+    async def cog_unload(self):
+        if not self._originals:
+            return
+        del self.bot.http.request
+        discord.webhook.async_.AsyncWebhookAdapter.request = self._originals["webhook"]
+        discord.ui.View._scheduled_task = self._originals["view"]
+        discord.ui.Modal._scheduled_task = self._originals["modal"]
+        logging.getLogger("discord.http").removeHandler(self.rate_limits)
+        logging.getLogger("discord.webhook.async_").removeHandler(self.rate_limits)
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        ctx.perf_start = time.perf_counter()
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        start = getattr(ctx, "perf_start", None)
+        if start is not None:
+            self.record("command", ctx.command.qualified_name, time.perf_counter() - start)
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        if ctx.command is None:
+            return
+        self.counters[("command_errors", f"{ctx.command.qualified_name} {type(error).__name__}")] += 1
+        start = getattr(ctx, "perf_start", None)
+        if start is not None:
+            self.record("command", ctx.command.qualified_name, time.perf_counter() - start)
+
+    @commands.Cog.listener()
+    async def on_attachment_download(self, attachment, seconds):
+        kind = (attachment.content_type or "other").partition("/")[0]
+        self.record("attachment", kind, seconds)
+        self.counters[("attachment_bytes", kind)] += attachment.size
+
+    def gauges(self):
+        """Open conversation gauges of every cog that exposes a router."""
+        gauges = {}
+        for name, cog in self.bot.cogs.items():
+            router = getattr(cog, "router", None)
+            if router is not None:
+                for gauge, value in router.gauges().items():
+                    gauges[(name, gauge)] = value
+        return gauges
+
+    def prometheus(self):
+        lines = []
+        kinds = {
+            "command": "Command latency from invocation to completion.",
+            "interaction": "Component and modal callback latency.",
+            "http": "Discord API request latency.",
+            "attachment": "Report attachment download latency."
+        }
+        for kind, help_text in kinds.items():
+            metric = f"modmail_{kind}_latency_seconds"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} summary")
+            for (hist_kind, route), histogram in sorted(self.histograms.items()):
+                if hist_kind != kind:
+                    continue
+                label = route.replace("\\", "\\\\").replace('"', '\\"')
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{route="{label}",quantile="{q}"}} {histogram.quantile(q) / 1_000_000}')
+                lines.append(f'{metric}_sum{{route="{label}"}} {histogram.total / 1_000_000}')
+                lines.append(f'{metric}_count{{route="{label}"}} {histogram.count}')
+
+        counters = {}
+        for (name, label), value in self.counters.items():
+            counters.setdefault(name, []).append((label, value))
+        for name, values in sorted(counters.items()):
+            metric = f"modmail_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for label, value in sorted(values):
+                label = label.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{metric}{{label="{label}"}} {value}')
+
+        lines.append("# TYPE modmail_open_conversations gauge")
+        for (cog, gauge), value in sorted(self.gauges().items()):
+            lines.append(f'modmail_open_conversations{{cog="{cog}",kind="{gauge}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    @commands.group(invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def perf(self, ctx, kind: str = "command"):
+        """
+        Show latency percentiles for `command`, `interaction`, `http` or `attachment` routes.
+        """
+        rows = sorted(
+            ((route, h) for (k, route), h in self.histograms.items() if k == kind),
+            key=lambda x: x[1].count,
+            reverse=True
+        )[:20]
+        if not rows:
+            return await ctx.send(f"Nothing has been recorded for `{kind}` yet.")
+        lines = [f"{'route':<40} {'count':>6} {'p50':>8} {'p99':>8} {'max':>8}"]
+        for route, h in rows:
+            lines.append(
+                f"{route[:40]:<40} {h.count:>6} {h.quantile(0.5) / 1000:>7.1f}ms {h.quantile(0.99) / 1000:>7.1f}ms {h.max / 1000:>7.1f}ms"
+            )
+        rate_limited = sum(v for (name, _), v in self.counters.items() if name == "rate_limited")
+        errors = sum(v for (name, _), v in self.counters.items() if name == "http_errors")
+        lines.append(f"\n429s: {rate_limited} | HTTP errors: {errors}")
+        for (cog, gauge), value in sorted(self.gauges().items()):
+            lines.append(f"{cog} {gauge}: {value}")
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @perf.command(name="export")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def perf_export(self, ctx):
+        """
+        Export every metric in the Prometheus text format.
+        """
+        data = io.BytesIO(self.prometheus().encode())
+        await ctx.send(file=discord.File(data, filename="modmail_perf.prom"))
+
+    @perf.command(name="embeds")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def perf_embeds(self, ctx, iterations: int = 2000):
+        """
+        Compare building every cached embed template from scratch with copying it.
+        """
+        lines = [f"{'template':<32} {'build':>14} {'copy':>14}"]
+        for cog_name, cog in sorted(self.bot.cogs.items()):
+            templates = getattr(cog, "templates", None)
+            if templates is None:
+                continue
+            for (name, guild_id, color) in list(templates.cache):
+                builder = templates.builders[name]
+                built, build_time = allocations(lambda: builder(guild_id, color), iterations)
+                copied, copy_time = allocations(lambda: templates.get(name, guild_id, color), iterations)
+                lines.append(
+                    f"{(cog_name + '.' + name)[:32]:<32} {built:>5.1f} {build_time * 1_000_000:>5.1f}us {copied:>5.1f} {copy_time * 1_000_000:>5.1f}us"
+                )
+        if len(lines) == 1:
+            return await ctx.send("No embed templates have been used yet.")
+        lines.append("\nblocks allocated and time per embed")
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @perf.command(name="reset")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def perf_reset(self, ctx):
+        """
+        Clear every recorded histogram and counter.
+        """
+        self.histograms.clear()
+        self.counters.clear()
+        await ctx.send("Performance metrics have been reset.")
+
+
+async def setup(bot):
+    await bot.add_cog(Perf(bot))
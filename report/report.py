@@ -3,195 +3,631 @@ from discord.ext import commands
 from core import checks
 from core.models import PermissionLevel
 import asyncio
+import io
+import math
+import re
+import tempfile
+import time
+from collections import defaultdict, deque
+from importlib import import_module
+
+# Helpers shared with the other plugins, from the "common" plugin installed next to this one
+common = import_module(f"..{__package__.rpartition('.')[2].replace('report', 'common', 1)}.common", __package__)
+
+# Attachments larger than this are linked instead of re-uploaded
+LINK_THRESHOLD = 8 * 1024 * 1024
+# Total bytes re-uploaded per report, anything over the budget is linked
+REPORT_BYTE_BUDGET = 24 * 1024 * 1024
+# Downloads are kept in memory up to this size and spooled to a temp file after that
+SPOOL_THRESHOLD = 1024 * 1024
+# Attachment downloads running at once across every report
+DOWNLOAD_CONCURRENCY = 3
+
+# Reports about the same username in the same channel within this many seconds are threaded together
+DUPLICATE_WINDOW = 24 * 60 * 60
+# Trigram similarity of two usernames for their reports to count as duplicates on their own,
+# or together with REASON_SIMILARITY for reasons that are worded alike
+USERNAME_SIMILARITY = 0.8
+LOOSE_USERNAME_SIMILARITY = 0.5
+REASON_SIMILARITY = 0.5
+
+# Reports shown per page of -reports search
+SEARCH_PAGE_SIZE = 10
+
+# Report channels of the guilds that were set up before routes were configurable,
+# guilds without a route of their own fall back to the None entry.
+DEFAULT_ROUTES = {
+    814758983238942720: {"staff": 818446997816082432, "guest": 818447055810199552},
+    None: {"staff": 686253307278393442, "guest": 686253328270884877}
+}
+
+
+def report_templates():
+    templates = common.EmbedTemplates()
+    templates.register("timeout", lambda guild_id, color: discord.Embed(description="❌ | You took too long! Command cancelled", color=15158332))
+    templates.register("cancel", lambda guild_id, color: discord.Embed(description="❌ | Cancelled report", color=15158332))
+    templates.register("success", lambda guild_id, color: discord.Embed(description="✅ | The report has successfully been sent!", color=3066993))
+
+    def prompt(guild_id, color):
+        texta = """**Choose the type of your report:**
+  1️⃣ | Staff Report
+  2️⃣ | Guest Report
+  ❌ | Cancel
+  """
+        embed1 = discord.Embed(description=texta, color=color)
+        embed1.set_footer(text="Press ❌ to cancel")
+        return embed1
+    templates.register("prompt", prompt)
+    return templates
 
 
-class Reports(commands.Cog):
+def trigrams(text):
+    text = f"  {' '.join(text.lower().split())} "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class SpooledFile(io.RawIOBase):
     """
-    Easy report system right here!
+    discord.File only accepts io.IOBase objects, which SpooledTemporaryFile
+    is not before Python 3.11, so older versions read it through this.
     """
 
-    def __init__(self, bot):
-        self.bot = bot
-        self.coll = bot.plugin_db.get_partition(self)
+    def __init__(self, fp):
+        self.fp = fp
 
-    @commands.command()
-    @checks.has_permissions(PermissionLevel.REGULAR)
-    @commands.cooldown(1, 30, commands.BucketType.user)
-    async def report(self, ctx):
-        """
-        Report a player.
-        """
-        try:
-            staffChannel = self.bot.get_channel(686253307278393442)
-            guestChannel = self.bot.get_channel(686253328270884877)
-            if ctx.guild.id == 814758983238942720:
-                staffChannel = self.bot.get_channel(818446997816082432)
-                guestChannel = self.bot.get_channel(818447055810199552)
-            
-            texta = """**React with the type of your report:**
-  1️⃣ | Staff Report
-  2️⃣ | Guest Report
-  ❌ | Cancel
-  """
+    def readable(self):
+        return True
 
-            embedTimeout = discord.Embed(description="❌ | You took too long! Command cancelled", color=15158332)
-            embed1 = discord.Embed(description=texta, color=self.bot.main_color)
-            embed1.set_footer(text="React with ❌ to cancel")
-            reactionmsg = await ctx.send(content=f"<@!{ctx.author.id}>", embed=embed1)
-            for emoji in ('1️⃣', '2️⃣', '❌'):
-                await reactionmsg.add_reaction(emoji)
+    def seekable(self):
+        return True
 
-            def checkmsg(msg: discord.Message):
-                return msg.channel == ctx.channel and msg.author == ctx.author
+    def readinto(self, buffer):
+        data = self.fp.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
 
-            def cancel_check(msg: discord.Message):
-              return msg.content.lower() == "cancel" or msg.content.lower() == f"{ctx.prefix}cancel"
-            
-            def check(r, u):
-                return u == ctx.author
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.fp.seek(offset, whence)
 
-            try:
-                reaction, user = await self.bot.wait_for("reaction_add", timeout=20.0, check=check)
-            except asyncio.TimeoutError:
-                return await reactionmsg.edit(embed=embedTimeout)
+    def tell(self):
+        return self.fp.tell()
 
-            if str(reaction.emoji) == '1️⃣':
-                await reactionmsg.clear_reactions()
+    def close(self):
+        self.fp.close()
+        super().close()
 
-                text = "**Staff Report**\nWhat is the **username** of the user you're reporting? You have 2 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=self.bot.main_color))
 
-                try:
-                    username = await self.bot.wait_for('message', check=checkmsg, timeout=120)
-                    if cancel_check(username) is True:
-                      cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                      await reactionmsg.edit(embed=cancelEmbed)
-                      await reactionmsg.clear_reactions()
-                      return
-                except asyncio.TimeoutError:
+class ReportIndex:
+    """
+    Trigram index over the usernames of the reports sent in the last DUPLICATE_WINDOW seconds.
+    Only reports sharing a trigram with the new username are compared, so a lookup stays cheap
+    however many reports are indexed.
+    """
 
-                    return await reactionmsg.edit(embed=embedTimeout)
-                await username.delete()
+    def __init__(self):
+        self.reports = {}  # report message id -> (channel id, username trigrams, reason trigrams)
+        self.postings = defaultdict(set)  # (channel id, trigram) -> report message ids
+        self.expiry = deque()  # (created at, report message id), oldest first
+
+    def add(self, message_id, channel_id, username, reason, created_at):
+        grams = trigrams(username)
+        self.reports[message_id] = (channel_id, grams, trigrams(reason))
+        for gram in grams:
+            self.postings[(channel_id, gram)].add(message_id)
+        self.expiry.append((created_at, message_id))
+
+    def expire(self, now):
+        while self.expiry and self.expiry[0][0] <= now - DUPLICATE_WINDOW:
+            _, message_id = self.expiry.popleft()
+            channel_id, grams, _ = self.reports.pop(message_id)
+            for gram in grams:
+                postings = self.postings[(channel_id, gram)]
+                postings.discard(message_id)
+                if not postings:
+                    del self.postings[(channel_id, gram)]
+
+    def find_duplicate(self, channel_id, username, reason, now):
+        """Returns the message ID of the most similar recent report in the channel, if one is similar enough."""
+        self.expire(now)
+        grams = trigrams(username)
+        # A username with a similarity of at least t shares at least t * len(grams) trigrams,
+        # so it has to contain one of the len(grams) - ceil(t * len(grams)) + 1 rarest ones.
+        postings = sorted((self.postings.get((channel_id, gram), ()) for gram in grams), key=len)
+        candidates = set().union(*postings[:len(grams) - math.ceil(LOOSE_USERNAME_SIMILARITY * len(grams)) + 1])
+        best, best_score = None, 0
+        reason_grams = None
+        for message_id in candidates:
+            _, other, other_reason = self.reports[message_id]
+            score = similarity(grams, other)
+            if score < USERNAME_SIMILARITY:
+                if score < LOOSE_USERNAME_SIMILARITY:
+                    continue
+                if reason_grams is None:
+                    reason_grams = trigrams(reason)
+                if similarity(reason_grams, other_reason) < REASON_SIMILARITY:
+                    continue
+            if score > best_score or (score == best_score and message_id > best):
+                best, best_score = message_id, score
+        return best
+
+
+class ConversationRouter:
+    """
+    Hands incoming messages to the conversations waiting for them.
+    Waits are indexed by (channel, author) so each message costs one dict
+    lookup, no matter how many conversations are open.
+    """
 
-                text = "**Staff Report**\nWhat is the **rank** of the suspect? You have 2 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=self.bot.main_color))
+    def __init__(self):
+        self.message_waits = {}  # (channel id, author id) -> [futures]
 
-                try:
-                    rank = await self.bot.wait_for('message', check=checkmsg, timeout=120)
-                    if cancel_check(rank) is True:
-                      cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                      await reactionmsg.edit(embed=cancelEmbed)
-                      await reactionmsg.clear_reactions()
-                      return
-                except asyncio.TimeoutError:
-                    return await reactionmsg.edit(embed=embedTimeout)
-                await rank.delete()
-
-                text = "**Staff Report**\nWhat is the **reason** for this report? You have 2 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=self.bot.main_color, ))
+    async def wait_for_message(self, channel_id, author_id, timeout):
+        key = (channel_id, author_id)
+        future = asyncio.get_running_loop().create_future()
+        self.message_waits.setdefault(key, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            pending = self.message_waits.get(key)
+            if pending is not None and future in pending:
+                pending.remove(future)
+                if not pending:
+                    del self.message_waits[key]
+
+    def dispatch_message(self, message):
+        pending = self.message_waits.pop((message.channel.id, message.author.id), None)
+        if not pending:
+            return False
+        for future in pending:
+            if not future.done():
+                future.set_result(message)
+        return True
+
+    def gauges(self):
+        """Number of open conversations waiting for a message."""
+        return {"message_waits": sum(len(x) for x in self.message_waits.values())}
+
+
+class ReportModal(discord.ui.Modal):
+    """
+    Asks for every detail of a staff or guest report at once.
+    """
 
-                try:
-                    reason = await self.bot.wait_for('message', check=checkmsg, timeout=120)
-                    if cancel_check(reason) is True:
-                      cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                      await reactionmsg.edit(embed=cancelEmbed)
-                      await reactionmsg.clear_reactions()
-                      return
-                except asyncio.TimeoutError:
-                    return await reactionmsg.edit(embed=embedTimeout)
-                await reason.delete()
-
-                text = "**Staff Report**\nPlease provide proof of this happening. You can upload a video/image or use a link to an image or video. You can attach multiple videos/images/links, but they must be in the same message. The report will be sent right after. You have 10 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=self.bot.main_color))
+    def __init__(self, cog, ctx, kind):
+        super().__init__(title=f"{kind} Report", timeout=600)
+        self.cog = cog
+        self.ctx = ctx
+        self.kind = kind
+        self.username = discord.ui.TextInput(label="Username", placeholder="The username of the user you're reporting", max_length=100)
+        self.add_item(self.username)
+        self.rank = None
+        if kind == "Staff":
+            self.rank = discord.ui.TextInput(label="Rank", placeholder="The rank of the suspect", max_length=100)
+            self.add_item(self.rank)
+        self.reason = discord.ui.TextInput(label="Reason", style=discord.TextStyle.paragraph, max_length=1024)
+        self.add_item(self.reason)
+        self.proof = discord.ui.TextInput(
+            label="Proof",
+            style=discord.TextStyle.paragraph,
+            placeholder="Links to images or videos. Leave this empty to upload files instead.",
+            required=False,
+            max_length=1024
+        )
+        self.add_item(self.proof)
+        self.message = None
+
+    async def on_submit(self, interaction: discord.Interaction):
+        await self.cog.submit_report(interaction, self)
+
+    async def on_timeout(self):
+        await self.cog.edits.edit(self.message, embed=self.cog.templates.template("timeout"), view=None)
+
+
+class ReportView(discord.ui.View):
+    """
+    Lets the author pick the type of their report.
+    """
 
-                try:
-                    proof = await self.bot.wait_for('message', check=checkmsg, timeout=600)
-                    if cancel_check(proof) is True:
-                      cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                      await reactionmsg.edit(embed=cancelEmbed)
-                      await reactionmsg.clear_reactions()
-                      return
-                except asyncio.TimeoutError:
-                    return await reactionmsg.edit(embed=embedTimeout)
-                my_files = [await x.to_file() for x in proof.attachments]
-                await proof.delete()
+    def __init__(self, cog, ctx):
+        super().__init__(timeout=20)
+        self.cog = cog
+        self.ctx = ctx
+        self.message = None
 
-                reportEmbed = discord.Embed(title="New Staff Report", color=self.bot.main_color)
-                reportEmbed.add_field(name="Username:", value=username.content)
-                reportEmbed.add_field(name="Rank:", value=rank.content)
-                reportEmbed.add_field(name="Reason:", value=reason.content)
-                if proof.content:
-                    reportEmbed.add_field(name="Proof:", value=proof.content)
-                reportEmbed.set_author(name=ctx.author, icon_url=ctx.author.avatar.url)
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.ctx.author.id:
+            await interaction.response.send_message("This isn't your report.", ephemeral=True)
+            return False
+        return True
 
-                await staffChannel.send(content="---------------------------", embed=reportEmbed, files=my_files)
-                text = "✅ | The report has successfully been sent!"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=3066993))
+    async def open_modal(self, interaction, kind):
+        self.stop()
+        modal = ReportModal(self.cog, self.ctx, kind)
+        modal.message = self.message
+        await interaction.response.send_modal(modal)
 
-            if str(reaction.emoji) == '2️⃣':
-                await reactionmsg.clear_reactions()
+    @discord.ui.button(label="Staff Report", emoji="1️⃣", style=discord.ButtonStyle.primary)
+    async def staff_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.open_modal(interaction, "Staff")
 
-                text = "**Guest Report**\nWhat is the **username** of the user you're reporting? You have 2 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=self.bot.main_color))
+    @discord.ui.button(label="Guest Report", emoji="2️⃣", style=discord.ButtonStyle.primary)
+    async def guest_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.open_modal(interaction, "Guest")
 
-                try:
-                    username = await self.bot.wait_for('message', check=checkmsg, timeout=120)
-                    if cancel_check(username) is True:
-                      cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                      await reactionmsg.edit(embed=cancelEmbed)
-                      await reactionmsg.clear_reactions()
-                      return
-                except asyncio.TimeoutError:
+    @discord.ui.button(label="Cancel", emoji="❌", style=discord.ButtonStyle.secondary)
+    async def cancel_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
+        await interaction.response.edit_message(embed=self.cog.templates.template("cancel"), view=None)
 
-                    return await reactionmsg.edit(embed=embedTimeout)
-                await username.delete()
+    async def on_timeout(self):
+        await self.cog.edits.edit(self.message, embed=self.cog.templates.template("timeout"), view=None)
 
-                text = "**Guest Report**\nWhat is the **reason** for this report? You have 2 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=self.bot.main_color, ))
 
-                try:
-                    reason = await self.bot.wait_for('message', check=checkmsg, timeout=120)
-                    if cancel_check(reason) is True:
-                      cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                      await reactionmsg.edit(embed=cancelEmbed)
-                      await reactionmsg.clear_reactions()
-                      return
-                except asyncio.TimeoutError:
-                    return await reactionmsg.edit(embed=embedTimeout)
-                await reason.delete()
-
-                text = "**Guest Report**\nPlease provide proof of this happening. You can upload a video/image or use a link to an image or video. You can attach multiple videos/images/links, but they must be in the same message. The report will be sent right after. You have 10 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=self.bot.main_color))
+class ReportFilters(commands.FlagConverter, prefix="", delimiter=":"):
+    user: str = None
+    kind: str = commands.flag(name="type", default=None)
+    reporter: discord.User = None
+    days: int = None
 
-                try:
-                    proof = await self.bot.wait_for('message', check=checkmsg, timeout=600)
-                    if cancel_check(proof) is True:
-                      cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                      await reactionmsg.edit(embed=cancelEmbed)
-                      await reactionmsg.clear_reactions()
-                      return
-                except asyncio.TimeoutError:
-                    return await reactionmsg.edit(embed=embedTimeout)
-                my_files = [await x.to_file() for x in proof.attachments]
-                await proof.delete()
 
-                reportEmbed = discord.Embed(title="New Guest Report", color=self.bot.main_color)
-                reportEmbed.add_field(name="Username:", value=username.content)
-                if proof.content:
-                    reportEmbed.add_field(name="Proof:", value=proof.content)
-                reportEmbed.add_field(name="Reason:", value=reason.content)
-                reportEmbed.set_author(name=ctx.author, icon_url=ctx.author.avatar.url)
-                await guestChannel.send(content="---------------------------", embed=reportEmbed, files=my_files)
-                text = "✅ | The report has successfully been sent!"
-                await reactionmsg.edit(embed=discord.Embed(description=text, color=3066993))
-
-            if str(reaction.emoji) == '❌':
-                cancelEmbed = discord.Embed(description="❌ | Cancelled report", color=15158332)
-                await reactionmsg.edit(embed=cancelEmbed)
-                return await reactionmsg.clear_reactions()
+def search_order(filters):
+    """
+    Returns the sort keys of a search. A username prefix matches a range of usernames, which the
+    index returns grouped by username, so those results are sorted by username before date.
+    """
+    order = [("created_at", -1), ("message_id", -1)]
+    if filters.user and filters.user.strip().endswith("*"):
+        order.insert(0, ("username_key", 1))
+    return order
+
+
+class ReportSearchView(discord.ui.View):
+    """
+    Pages through search results. Every page is fetched with the position of the last report
+    on the page before it, so the result set is never counted or skipped through.
+    """
+
+    def __init__(self, cog, ctx, filters):
+        super().__init__(timeout=120)
+        self.cog = cog
+        self.ctx = ctx
+        self.filters = filters
+        self.cursors = [None]  # where each page up to the current one starts
+        self.next_cursor = None
+        self.message = None
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.ctx.author.id:
+            await interaction.response.send_message("This isn't your search.", ephemeral=True)
+            return False
+        return True
+
+    async def render(self):
+        docs = await self.cog.search_reports(self.ctx.guild.id, self.filters, self.cursors[-1])
+        self.next_cursor = None
+        if len(docs) > SEARCH_PAGE_SIZE:
+            docs = docs[:SEARCH_PAGE_SIZE]
+            self.next_cursor = tuple(docs[-1][key] for key, _ in search_order(self.filters))
+        self.newer_button.disabled = len(self.cursors) == 1
+        self.older_button.disabled = self.next_cursor is None
+        lines = []
+        for doc in docs:
+            link = f"https://discord.com/channels/{doc['guild_id']}/{doc['channel_id']}/{doc['message_id']}"
+            line = f"<t:{doc['created_at']}:d> **{doc['kind'].capitalize()}** | {discord.utils.escape_markdown(doc['username'])} | by <@{doc['reporter_id']}> | [Jump]({link})"
+            if doc.get("duplicates"):
+                line += f" (+{doc['duplicates']})"
+            lines.append(line)
+        embed = discord.Embed(
+            title="Report Search",
+            description="\n".join(lines) or "No reports found.",
+            color=self.cog.bot.main_color
+        )
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        return embed
+
+    @discord.ui.button(label="Newer", emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def newer_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    @discord.ui.button(label="Older", emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def older_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.next_cursor)
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    async def on_timeout(self):
+        await self.cog.edits.edit(self.message, view=None)
+
+
+class Reports(commands.Cog):
+    """
+    Easy report system right here!
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.coll = bot.plugin_db.get_partition(self)
+        self.router = ConversationRouter()
+        self.edits = common.EditCoalescer()
+        self.templates = report_templates()
+        self.cooldowns = common.cooldown_backend()
+        self.routes = {}  # guild id -> {report type: channel id}
+        self.channels = {}  # channel id -> resolved channel
+        self.downloads = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        self.index = ReportIndex()
+
+    async def cog_load(self):
+        async for doc in self.coll.find({"routes": {"$exists": True}}):
+            self.routes[doc["guild_id"]] = doc["routes"]
+        # Every search filter has an index that also covers the result order, so a page is a single index range
+        for field in ("username_key", "kind", "reporter_id", None):
+            keys = [("guild_id", 1)] + ([(field, 1)] if field else []) + [("created_at", -1), ("message_id", -1)]
+            await self.coll.create_index(keys)
+        since = int(time.time()) - DUPLICATE_WINDOW
+        # Like in record_report, reports threaded under an earlier one aren't indexed
+        async for doc in self.coll.find({"created_at": {"$gt": since}, "duplicate_of": None}).sort("created_at", 1):
+            self.index.add(doc["message_id"], doc["channel_id"], doc["username"], doc["reason"], doc["created_at"])
+
+    async def cog_unload(self):
+        self.cooldowns.close()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        self.router.dispatch_message(message)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.channels.pop(channel.id, None)
+
+    def report_channel(self, guild_id, kind):
+        routes = self.routes.get(guild_id) or DEFAULT_ROUTES.get(guild_id) or DEFAULT_ROUTES[None]
+        channel_id = routes.get(kind)
+        if channel_id is None:
+            return None
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.bot.get_channel(channel_id)
+            if channel is not None:
+                self.channels[channel_id] = channel
+        return channel
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def reportchannel(self, ctx, kind: str.lower, channel: discord.TextChannel):
+        """
+        Set the channel staff or guest reports of this server are sent to.
+
+        **Usage**:
+        -reportchannel staff #staff-reports
+        """
+        if kind not in ("staff", "guest"):
+            return await ctx.send("The report type has to be `staff` or `guest`.")
+        routes = dict(self.routes.get(ctx.guild.id) or DEFAULT_ROUTES.get(ctx.guild.id) or {})
+        old = routes.get(kind)
+        routes[kind] = channel.id
+        await self.coll.update_one(
+            {"_id": f"config:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, "routes": routes}},
+            upsert=True
+        )
+        self.routes[ctx.guild.id] = routes
+        self.channels.pop(old, None)
+        await ctx.send(f"{kind.capitalize()} reports will now be sent in {channel.mention}.")
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.REGULAR)
+    @common.shared_cooldown(30)
+    async def report(self, ctx):
+        """
+        Report a player.
+        """
+        try:
+            embed1 = self.templates.template("prompt", color=self.bot.main_color)
+            view = ReportView(self, ctx)
+            view.message = await ctx.send(content=f"<@!{ctx.author.id}>", embed=embed1, view=view)
         except discord.ext.commands.CommandOnCooldown:
             print("cooldown")
 
+    async def submit_report(self, interaction, modal):
+        modal.stop()  # The proof step below has its own timeout
+        ctx = modal.ctx
+        proofText = modal.proof.value
+        my_files, links = [], []
+
+        if not proofText:
+            # Files can't be uploaded through a modal, so only then the proof is asked for in chat
+            text = f"**{modal.kind} Report**\nPlease provide proof of this happening. You can upload a video/image or use a link to an image or video. You can attach multiple videos/images/links, but they must be in the same message. The report will be sent right after. You have 10 minutes to reply.\n\n*Say 'cancel' to cancel the report.*"
+            await interaction.response.edit_message(embed=discord.Embed(description=text, color=self.bot.main_color), view=None)
+
+            try:
+                proof = await self.router.wait_for_message(ctx.channel.id, ctx.author.id, 600)
+            except asyncio.TimeoutError:
+                return await self.edits.edit(modal.message, embed=self.templates.template("timeout"))
+            if proof.content.lower() in ("cancel", f"{ctx.prefix}cancel"):
+                return await self.edits.edit(modal.message, embed=self.templates.template("cancel"))
+            my_files, links = await self.forward_attachments(proof.attachments)
+            proofText = proof.content
+            if links:
+                # Linked attachments only stay up as long as the message they were sent in
+                links.append(proof.jump_url)
+            else:
+                await proof.delete()
+        else:
+            # Sending the report can take longer than the 3 seconds the interaction has to be answered in
+            await interaction.response.defer()
+
+        reportEmbed = discord.Embed(title=f"New {modal.kind} Report", color=self.bot.main_color)
+        reportEmbed.add_field(name="Username:", value=modal.username.value)
+        if modal.rank is not None:
+            reportEmbed.add_field(name="Rank:", value=modal.rank.value)
+        reportEmbed.add_field(name="Reason:", value=modal.reason.value)
+        if proofText:
+            reportEmbed.add_field(name="Proof:", value=proofText[:1024])
+        reportEmbed.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
+
+        channel = self.report_channel(ctx.guild.id, modal.kind.lower())
+        if channel is None:
+            for file in my_files:
+                file.close()
+            errorEmbed = discord.Embed(description=f"❌ | {modal.kind} reports aren't set up in this server.", color=15158332)
+            return await self.edits.edit(modal.message, embed=errorEmbed, view=None)
+        now = int(time.time())
+        original_id = self.index.find_duplicate(channel.id, modal.username.value, modal.reason.value, now)
+        try:
+            content = "\n".join(["---------------------------", *links])
+            msg = None
+            if original_id is not None:
+                msg = await self.send_to_thread(channel, original_id, modal.username.value, content=content, embed=reportEmbed, files=my_files)
+            if msg is None:
+                original_id = None
+                msg = await channel.send(content=content, embed=reportEmbed, files=my_files)
+        finally:
+            for file in my_files:
+                file.close()
+        await self.record_report(msg, channel, modal, proofText, original_id, now)
+
+        successEmbed = self.templates.get("success")
+        if original_id is not None:
+            successEmbed.description += f" It was added to the [existing report](https://discord.com/channels/{ctx.guild.id}/{channel.id}/{original_id}) about this user."
+        await self.edits.edit(modal.message, embed=successEmbed, view=None)
+
+    async def send_to_thread(self, channel, message_id, username, **kwargs):
+        """Sends a report in the thread of an earlier report about the same user, returns None if that isn't possible."""
+        # A thread started from a message shares its ID
+        thread = channel.guild.get_thread(message_id)
+        try:
+            if thread is None:
+                try:
+                    thread = await channel.get_partial_message(message_id).create_thread(name=f"Reports about {username}"[:100])
+                except discord.HTTPException:
+                    # The thread exists but isn't cached, for example when it was archived
+                    thread = await channel.guild.fetch_channel(message_id)
+            return await thread.send(**kwargs)
+        except discord.HTTPException as e:
+            print(f"Failed to add the report to the thread of {message_id}: {e}")
+            return None
+
+    async def record_report(self, msg, channel, modal, proof, duplicate_of, created_at):
+        await self.coll.insert_one({
+            "_id": f"report:{msg.id}",
+            "guild_id": channel.guild.id,
+            # The thread for reports added to an earlier one, so jump links point at the message
+            "channel_id": msg.channel.id,
+            "message_id": msg.id,
+            "kind": modal.kind.lower(),
+            "username": modal.username.value,
+            "username_key": modal.username.value.strip().lower(),
+            "rank": modal.rank.value if modal.rank is not None else None,
+            "reason": modal.reason.value,
+            "proof": proof,
+            "reporter_id": modal.ctx.author.id,
+            "created_at": created_at,
+            "duplicate_of": duplicate_of
+        })
+        if duplicate_of is None:
+            # Later reports are threaded under the first one, so only that one is indexed
+            self.index.add(msg.id, channel.id, modal.username.value, modal.reason.value, created_at)
+        else:
+            await self.coll.update_one({"_id": f"report:{duplicate_of}"}, {"$inc": {"duplicates": 1}})
+
+    async def search_reports(self, guild_id, filters, before=None):
+        """Returns up to SEARCH_PAGE_SIZE + 1 reports matching the filters, in search order, that come after the before cursor."""
+        query = {"guild_id": guild_id, "created_at": {"$exists": True}}
+        order = search_order(filters)
+        if filters.user:
+            user = filters.user.strip().lower()
+            if user.endswith("*"):
+                query["username_key"] = {"$regex": "^" + re.escape(user.rstrip("*"))}
+            else:
+                query["username_key"] = user
+        if filters.kind:
+            query["kind"] = filters.kind.lower()
+        if filters.reporter:
+            query["reporter_id"] = filters.reporter.id
+        if filters.days:
+            query["created_at"] = {"$gte": int(time.time()) - filters.days * 24 * 60 * 60}
+        if before is not None:
+            # Everything after the cursor: equal on the leading sort keys and past it on the next one
+            query["$or"] = [
+                {**{key: value for (key, _), value in zip(order[:i], before)}, key: {"$gt" if direction > 0 else "$lt": before[i]}}
+                for i, (key, direction) in enumerate(order)
+            ]
+        cursor = self.coll.find(query).sort(order).limit(SEARCH_PAGE_SIZE + 1)
+        return [doc async for doc in cursor]
+
+    @commands.group(invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def reports(self, ctx):
+        """
+        Browse the reports sent in this server.
+        """
+        await ctx.send_help(ctx.command)
+
+    @reports.command(name="search")
+    @checks.has_permissions(PermissionLevel.MODERATOR)
+    async def reports_search(self, ctx, *, filters: ReportFilters):
+        """
+        Search the reports sent in this server, newest first.
+        End the username with * to search every username starting with it, sorted by username.
+
+        **Usage**:
+        -reports search user:CoolGuy type:staff reporter:@someone days:30
+        -reports search user:Cool*
+        """
+        view = ReportSearchView(self, ctx, filters)
+        view.message = await ctx.send(embed=await view.render(), view=view)
+
+    async def download_attachment(self, attachment):
+        """Streams an attachment into a spooled temp file and returns it as a discord.File."""
+        async with self.downloads:
+            start = time.perf_counter()
+            fp = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+            try:
+                async with self.bot.session.get(attachment.url) as resp:
+                    resp.raise_for_status()
+                    async for chunk in resp.content.iter_chunked(64 * 1024):
+                        fp.write(chunk)
+            except Exception:
+                fp.close()
+                raise
+            fp.seek(0)
+            # Picked up by the perf plugin as the "attachment" latency histogram
+            self.bot.dispatch("attachment_download", attachment, time.perf_counter() - start)
+        if not isinstance(fp, io.IOBase):
+            fp = SpooledFile(fp)
+        return discord.File(fp, filename=attachment.filename, spoiler=attachment.is_spoiler())
+
+    async def forward_attachments(self, attachments):
+        """
+        Downloads the attachments that fit in the report's byte budget concurrently.
+        Returns the files to upload and the URLs of the attachments that should be linked instead.
+        """
+        budget = REPORT_BYTE_BUDGET
+        to_download, links = [], []
+        for attachment in attachments:
+            if attachment.size > LINK_THRESHOLD or attachment.size > budget:
+                links.append(attachment.url)
+            else:
+                budget -= attachment.size
+                to_download.append(attachment)
+
+        results = await asyncio.gather(*(self.download_attachment(x) for x in to_download), return_exceptions=True)
+        files = []
+        for attachment, result in zip(to_download, results):
+            if isinstance(result, Exception):
+                print(f"Failed to download {attachment.filename}: {result}")
+                links.append(attachment.url)
+            else:
+                files.append(result)
+        return files, links
+
 
 async def setup(bot):
     await bot.add_cog(Reports(bot))
@@ -1,11 +1,16 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from datetime import datetime, timezone
 import asyncio
+from collections import namedtuple
+from importlib import import_module
 
 from core import checks
 from core.models import DummyMessage, PermissionLevel
 
+# Helpers shared with the other plugins, from the "common" plugin installed next to this one
+common = import_module(f"..{__package__.rpartition('.')[2].replace('shift', 'common', 1)}.common", __package__)
+
 ALLOWED_ROLES = [
     796317014209462332,
     686258158049558772,
@@ -21,6 +26,13 @@ END_ALLOWED = [
     686219247206137900
 ]
 
+# Capabilities resolved from a member's roles
+CAN_HOST = 1
+CAN_END = 2
+
+# Role names used by the shiftroles command
+ROLE_CAPABILITIES = {"host": CAN_HOST, "end": CAN_END}
+
 ADMIN_USERS = [
     497582356064894997,
     349899849937846273
@@ -31,16 +43,90 @@ emoji = "<:cow:1012643349150314496>"
 channel_id = 780879678730666086
 ping_role_id = 695243187043696650
 
+SHIFT_TIMEOUT = 108000  # 30 hours
+
+# Everything needed to end a shift without fetching its messages, embed is the announcement payload
+# and copies holds the (channel id, message id) of the announcement in every guild.
+ShiftSession = namedtuple("ShiftSession", "channel_id message_id host_id host started_at expires_at embed copies guild_id")
+
+def session_from_doc(doc):
+    return ShiftSession(
+        doc["channel_id"], doc["message_id"], doc["host_id"], doc.get("host"),
+        doc.get("started_at"), doc["expires_at"], doc.get("embed"),
+        [tuple(x) for x in doc.get("copies", [(doc["channel_id"], doc["message_id"])])],
+        doc.get("guild_id")
+    )
+
+def shift_announcement(guild_id, color):
+    embed = discord.Embed(
+        title="Shift",
+        description=f"A shift is currently being hosted at the hotel! Come to the hotel for a nice and comfy room! Active staff may get a chance of promotion.",
+        color=color
+    )
+    embed.add_field(name="Host", value="\u200b", inline=False)
+    embed.add_field(name="Session Status", value="\u200b", inline=False)
+    embed.add_field(name="Hotel Link", value="[Click here](https://www.roblox.com/games/4766198689/Work-at-a-Hotel-Vinns-Hotels)", inline=False)
+    embed.set_footer(text=f"Vinns Sessions")
+    return embed
+
+
+class ShiftView(discord.ui.View):
+    """
+    Persistent view for every shift message, sessions are looked up by message ID when clicked.
+    """
+
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        self.cog = cog
+
+    @discord.ui.button(label="End Shift", style=discord.ButtonStyle.danger, custom_id="shift:end")
+    async def end_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.end_shift_click(interaction)
+
 class ShiftManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.coll = bot.plugin_db.get_partition(self)
+        self.permissions = common.PermissionResolver({CAN_HOST: ALLOWED_ROLES, CAN_END: END_ALLOWED})
         self.shift_start_times = {}
         self.shift_channel_ids = {}
         self.shift_mention_roles = {}
+        self.sessions = {}  # message id of every copy -> ShiftSession, a local cache of the store
+        self.fanout = common.FanOut()
+        self.cooldowns = common.cooldown_backend()
+        self.edits = common.EditCoalescer(self.fanout)
+        self.templates = common.EmbedTemplates()
+        self.templates.register("announcement", shift_announcement)
+        self.deletions = common.DeletionScheduler(bot, self.coll)
+        self.store = common.session_backend(self.coll, "shift")
+
+    async def cog_load(self):
+        await self.store.create_indexes()
+        async for doc in self.coll.find({"roles": {"$exists": True}}):
+            for name, roles in doc["roles"].items():
+                self.permissions.set_roles(doc["guild_id"], ROLE_CAPABILITIES[name], roles)
+        self.bot.add_view(ShiftView(self))
+        async for doc in self.coll.find({"config": {"$exists": True}}):
+            if "channel_id" in doc["config"]:
+                self.shift_channel_ids[doc["guild_id"]] = doc["config"]["channel_id"]
+            if "mention_role_id" in doc["config"]:
+                self.shift_mention_roles[doc["guild_id"]] = doc["config"]["mention_role_id"]
+        for doc in await self.store.all():
+            session = session_from_doc(doc)
+            for _, message_id in session.copies:
+                self.sessions[message_id] = session
+        self.expire_shifts.start()
+        await self.deletions.start()
+
+    async def cog_unload(self):
+        self.expire_shifts.cancel()
+        self.deletions.stop()
+        self.cooldowns.close()
+        self.store.close()
 
     def is_allowed_role():
         async def predicate(ctx):
-            return any(role.id in ALLOWED_ROLES for role in ctx.author.roles)
+            return bool(ctx.cog.permissions.capabilities(ctx.author) & CAN_HOST)
         return commands.check(predicate)
 
     def is_admin_user():
@@ -62,117 +148,202 @@ class ShiftManager(commands.Cog):
         else:
             print("Target guild not found.")
 
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.permissions.invalidate(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.permissions.invalidate(role.guild.id)
+
     @commands.Cog.listener()
     async def on_ready(self):
         print(f'Logged in as {self.bot.user}!')
 
+    def announcement_targets(self):
+        """Returns (channel, mention role id) for every guild shifts are announced in."""
+        targets = {}
+        default = self.bot.get_channel(channel_id)
+        if default:
+            targets[default.guild.id] = (default, self.shift_mention_roles.get(default.guild.id, ping_role_id))
+        for guild_id, shift_channel_id in self.shift_channel_ids.items():
+            channel = self.bot.get_channel(shift_channel_id)
+            if channel:
+                targets[guild_id] = (channel, self.shift_mention_roles.get(guild_id, targets.get(guild_id, (None, None))[1]))
+        return list(targets.values())
+
     @commands.command(aliases=['s'])
     @checks.has_permissions(PermissionLevel.REGULAR)
     @is_allowed_role()
-    @commands.cooldown(1, 3600, commands.BucketType.user)
+    @common.shared_cooldown(3600)
     async def shift(self, ctx):
         self.shift_start_times[ctx.guild.id] = datetime.now(timezone.utc)
-        #shift_channel_id = self.shift_channel_ids.get(ctx.guild.id, channel_id)
-        #role_id = self.shift_mention_roles.get(ctx.guild.id, ping_role_id)
-        session_ping = f"<@&{ping_role_id}>"
         host_mention = ctx.author.mention
         start_time_unix = int(self.shift_start_times[ctx.guild.id].timestamp())
 
-        embed = discord.Embed(
-            title="Shift",
-            description=f"A shift is currently being hosted at the hotel! Come to the hotel for a nice and comfy room! Active staff may get a chance of promotion.",
-            color=self.bot.main_color
+        host = f"{host_mention} | {ctx.author}{' | ' + ctx.author.nick if ctx.author.nick else ''}"
+        embed = self.templates.get(
+            "announcement", ctx.guild.id, self.bot.main_color,
+            values={0: host, 1: f"Started <t:{start_time_unix}:R>"}
         )
-        embed.add_field(name="Host", value=f"{host_mention} | {ctx.author}{' | ' + ctx.author.nick if ctx.author.nick else ''}", inline=False)
-        embed.add_field(name="Session Status", value=f"Started <t:{start_time_unix}:R>", inline=False)
-        embed.add_field(name="Hotel Link", value="[Click here](https://www.roblox.com/games/4766198689/Work-at-a-Hotel-Vinns-Hotels)", inline=False)
-        embed.set_footer(text=f"Vinns Sessions")
-
-        channel = self.bot.get_channel(channel_id)
-        if channel:
-            # Create a button for ending the shift manually
-            button = discord.ui.Button(label="End Shift", style=discord.ButtonStyle.danger)
 
-            # Create a view with a timeout of 3 hours (10800 seconds)
-            view = discord.ui.View(timeout=108000)  
-            view.add_item(button)
-
-            # Send the shift announcement
-            msg = await channel.send(f"{session_ping}", embed=embed, view=view)
-            self.shift_start_times[ctx.guild.id] = (datetime.now(timezone.utc), msg.id)
-
-            # Button callback for manually ending the shift
-            async def button_callback(interaction: discord.Interaction):
-                await interaction.response.defer()
-                # Check if the user has an allowed role
-                if interaction.user.id == ctx.author.id or any(role.id in END_ALLOWED for role in interaction.user.roles):
-                    await self.end_shift(ctx, msg, interaction.user)
-                    await interaction.response.send_message("Shift has ended.", ephemeral=True)
-                else:
-                    await interaction.response.send_message("You do not have permission to end the shift.", ephemeral=True)
-
-
-            button.callback = button_callback
-
-            # Handle the timeout (automatic shift end)
-            async def view_timeout():
-                await self.end_shift(ctx, msg, None)
-
-            view.on_timeout = view_timeout
+        targets = self.announcement_targets()
+        if not targets:
+            await ctx.send("The specified channel could not be found.")
+            return
 
-            await ctx.send(f"Shift has been started!")
+        view = common.render_only(ShiftView(self))
+
+        # Send the shift announcement to every guild at once
+        results = await self.fanout.gather([
+            (channel.id, lambda channel=channel, role_id=role_id: channel.send(f"<@&{role_id}>" if role_id else None, embed=embed, view=view))
+            for channel, role_id in targets
+        ])
+        copies = [(msg.channel.id, msg.id) for msg in results if isinstance(msg, discord.Message)]
+        failed = [(channel, e) for (channel, _), e in zip(targets, results) if isinstance(e, Exception)]
+        for channel, e in failed:
+            print(f"Failed to announce the shift in {channel.id}: {e}")
+        if not copies:
+            await ctx.send("The shift announcement could not be sent.")
+            return
 
+        first_channel_id, first_message_id = copies[0]
+        self.shift_start_times[ctx.guild.id] = (datetime.now(timezone.utc), first_message_id)
+        session = ShiftSession(
+            first_channel_id, first_message_id, ctx.author.id, host, start_time_unix,
+            start_time_unix + SHIFT_TIMEOUT, embed.to_dict(), copies, ctx.guild.id
+        )
+        for _, message_id in copies:
+            self.sessions[message_id] = session
+        await self.store.insert({
+            "_id": f"session:{first_message_id}",
+            "message_ids": [message_id for _, message_id in copies],
+            **session._asdict()
+        })
+
+        text = "Shift has been started!"
+        if len(targets) > 1:
+            text += f" Announced in {len(copies)}/{len(targets)} servers."
+        if failed:
+            text += "\n" + "\n".join(f"Couldn't announce in {channel.mention}: {e}" for channel, e in failed)
+        await ctx.send(text)
+
+    async def end_shift_click(self, interaction: discord.Interaction):
+        session = self.sessions.get(interaction.message.id)
+        if session is None:
+            # Shifts started by another process are only in the store
+            doc = await self.store.find(interaction.message.id)
+            if doc is None:
+                await interaction.response.send_message("This shift has already ended.", ephemeral=True)
+                return
+            session = session_from_doc(doc)
+        # Check if the user is the host or has an allowed role
+        if interaction.user.id == session.host_id or self.permissions.capabilities(interaction.user) & CAN_END:
+            await interaction.response.send_message("Shift has ended.", ephemeral=True)
+            await self.end_shift(session, interaction.user)
         else:
-            await ctx.send("The specified channel could not be found.")
-
-    
-    async def end_shift(self, ctx, msg, ended_by_user):
-        #shift_channel_id = self.shift_channel_ids.get(ctx.guild.id, ctx.channel.id)
-        channel = self.bot.get_channel(channel_id)
-        if not channel:
-            print("The shift channel could not be found.")
+            await interaction.response.send_message("You do not have permission to end the shift.", ephemeral=True)
+
+    @tasks.loop(minutes=1)
+    async def expire_shifts(self):
+        # Handle the timeout (automatic shift end)
+        now = int(datetime.now(timezone.utc).timestamp())
+        # The store is asked instead of the local cache so shifts started by other processes expire too
+        for doc in await self.store.expired(now):
+            await self.end_shift(session_from_doc(doc), None)
+
+    @expire_shifts.before_loop
+    async def before_expire_shifts(self):
+        await self.bot.wait_until_ready()
+
+    async def end_shift(self, session, ended_by_user):
+        for _, message_id in session.copies:
+            self.sessions.pop(message_id, None)
+        # Removing the session first makes sure a shift is only ended once
+        if await self.store.delete(f"session:{session.message_id}") is None:
             return
+        await common.record_history(
+            self.coll, session.message_id, session.guild_id, session.host_id, session.started_at,
+            int(datetime.now(timezone.utc).timestamp()), ended_by_user.id if ended_by_user else None
+        )
+
+        if session.embed is not None:
+            embed = discord.Embed.from_dict(session.embed)
+            host_field = session.host
+        else:
+            # Sessions started before their state was cached have to be fetched
+            channel = self.bot.get_channel(session.channel_id)
+            if not channel:
+                print("The shift channel could not be found.")
+                return
+            try:
+                original_msg = await channel.fetch_message(session.message_id)
+            except discord.HTTPException as e:
+                print(f"An error occurred while trying to fetch the message: {e}")
+                return
+            if not original_msg.embeds or original_msg.embeds[0].title != "Shift":
+                print("The message provided isn't valid.")
+                return
+            embed = original_msg.embeds[0]
+            host_field = embed.fields[0].value
+
+        # Update the embed to indicate the shift has ended
+        delete_time_unix = int(datetime.now(timezone.utc).timestamp() + 600)  # 10 minutes until message deletion
+
+        embed.title = "Shift Ended"
+        embed.description = f"The shift hosted by {host_field} has just ended. Thank you for attending! We appreciate your presence and look forward to seeing you at future shifts.\n\nDeleting this message <t:{delete_time_unix}:R>"
+        embed.color = 0xED4245
+        if ended_by_user:
+            embed.set_footer(text=f"Ended by: {ended_by_user.name}")
+        else:
+            embed.set_footer(text="Ended automatically after timeout.")
+        embed.clear_fields()
+
+        # Edit every copy of the announcement at once
+        copies = [(shift_channel_id, message_id) for shift_channel_id, message_id in session.copies if self.bot.get_channel(shift_channel_id)]
+        results = await asyncio.gather(*(
+            self.edits.edit(self.bot.get_channel(shift_channel_id).get_partial_message(message_id), embed=embed, view=None)
+            for shift_channel_id, message_id in copies
+        ), return_exceptions=True)
+
+        for (shift_channel_id, message_id), result in zip(copies, results):
+            if isinstance(result, discord.NotFound):
+                print("Message not found.")
+            elif isinstance(result, discord.Forbidden):
+                print("I don't have permission to access the message.")
+            elif isinstance(result, Exception):
+                print(f"An error occurred while trying to edit the message: {result}")
+            else:
+                # Delete the message after 10 minutes
+                await self.deletions.schedule(shift_channel_id, message_id, delete_time_unix)
 
-        try:
-            # Fetch the message we want to edit
-            original_msg = await channel.fetch_message(msg.id)
-            if original_msg.embeds and original_msg.author.id == self.bot.user.id:
-                embed = original_msg.embeds[0]
-                
-                # Update the embed to indicate the shift has ended
-                if embed.title == "Shift":
-                    host_field = embed.fields[0].value
-                    delete_time_unix = int(datetime.now(timezone.utc).timestamp() + 600)  # 10 minutes until message deletion
-
-                    embed.title = "Shift Ended"
-                    embed.description = f"The shift hosted by {host_field} has just ended. Thank you for attending! We appreciate your presence and look forward to seeing you at future shifts.\n\nDeleting this message <t:{delete_time_unix}:R>"
-                    embed.color = 0xED4245
-                    if ended_by_user:
-                        embed.set_footer(text=f"Ended by: {ended_by_user.name}")
-                    else:
-                        embed.set_footer(text="Ended automatically after timeout.")
-                    embed.clear_fields()
-
-                    # Edit the message with the updated embed
-                    await original_msg.edit(embed=embed, view=None)
-
-                    # Wait 10 minutes before deleting the message
-                    await asyncio.sleep(600)  # 600 seconds = 10 minutes
-                    await original_msg.delete()
-                else:
-                    print("The message provided isn't valid.")
-        except discord.NotFound:
-            print("Message not found.")
-        except discord.Forbidden:
-            print("I don't have permission to access the message.")
-        except discord.HTTPException as e:
-            print(f"An error occurred while trying to fetch or edit the message: {e}")
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.REGULAR)
+    async def shiftstats(self, ctx, member: discord.Member = None):
+        """
+        Show how many shifts were hosted in this server, or by a member, today, this week and in total.
+        """
+        subject = member.id if member else "guild"
+        total, today, week = await common.rollup_stats(self.coll, ctx.guild.id, subject)
+        embed = discord.Embed(
+            title=f"Shift Stats | {member or ctx.guild.name}",
+            color=self.bot.main_color
+        )
+        for name, doc in (("Today", today), ("This Week", week), ("All Time", total)):
+            embed.add_field(name=name, value=f"{doc.get('count', 0)} shifts | {common.format_duration(doc.get('seconds', 0))}", inline=False)
+        await ctx.send(embed=embed)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.OWNER)
     @is_admin_user()
     async def shiftmention(self, ctx, role: discord.Role):
         self.shift_mention_roles[ctx.guild.id] = role.id
+        await self.coll.update_one(
+            {"_id": f"config:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, "config.mention_role_id": role.id}},
+            upsert=True
+        )
         await ctx.send(f"{emoji} | Shift mention role set to {role.mention}.")
 
     @commands.command()
@@ -180,8 +351,31 @@ class ShiftManager(commands.Cog):
     @is_admin_user()
     async def shiftchannel(self, ctx, channel: discord.TextChannel):
         self.shift_channel_ids[ctx.guild.id] = channel.id
+        await self.coll.update_one(
+            {"_id": f"config:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, "config.channel_id": channel.id}},
+            upsert=True
+        )
         await ctx.send(f"{emoji} | Shift messages will now be sent in {channel.mention}.")
 
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.OWNER)
+    @is_admin_user()
+    async def shiftroles(self, ctx, name: str.lower, roles: commands.Greedy[discord.Role]):
+        """
+        Set the roles that can host (`host`) or end (`end`) shifts in this server.
+        """
+        if name not in ROLE_CAPABILITIES:
+            return await ctx.send(f"{emoji} | The role list has to be `host` or `end`.")
+        role_ids = [role.id for role in roles]
+        self.permissions.set_roles(ctx.guild.id, ROLE_CAPABILITIES[name], role_ids)
+        await self.coll.update_one(
+            {"_id": f"roles:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, f"roles.{name}": role_ids}},
+            upsert=True
+        )
+        await ctx.send(f"{emoji} | {name.capitalize()} roles set to {', '.join(role.mention for role in roles) or 'nobody'}.")
+
     @commands.command()
     @checks.has_permissions(PermissionLevel.OWNER)
     @is_admin_user()
@@ -196,12 +390,26 @@ class ShiftManager(commands.Cog):
     Shift Start Times: {self.shift_start_times}
     Shift Channel IDs: {self.shift_channel_ids}
     Shift Mention Roles: {self.shift_mention_roles}
-    Allowed Roles: {ALLOWED_ROLES}
+    Allowed Roles: {sorted(self.permissions.roles_for(ctx.guild.id)[CAN_HOST])}
+    End Roles: {sorted(self.permissions.roles_for(ctx.guild.id)[CAN_END])}
     Admin Users: {ADMIN_USERS}
     ```"""
     
         await ctx.send(config_info)
 
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.OWNER)
+    @is_admin_user()
+    async def shiftdeletes(self, ctx):
+        """
+        List the shift messages waiting to be deleted.
+        """
+        if not self.deletions.heap:
+            return await ctx.send(f"{emoji} | No shift messages are waiting to be deleted.")
+        jobs = sorted(self.deletions.heap)[:20]
+        lines = [f"<#{channel}> `{message}` <t:{int(delete_at)}:R>" for delete_at, channel, message in jobs]
+        await ctx.send(f"**{len(self.deletions.heap)} pending deletions**\n" + "\n".join(lines))
+
     @shift.error
     async def shift_error(self, ctx, error):
         if isinstance(error, commands.MissingRequiredArgument):
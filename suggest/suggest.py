@@ -1,8 +1,217 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from core import checks
 from core.models import PermissionLevel
+from pymongo import UpdateOne
+from bisect import bisect_left, insort
+from collections import defaultdict
+from importlib import import_module
 import asyncio
+import hashlib
+import re
+import struct
+
+# Helpers shared with the other plugins, from the "common" plugin installed next to this one
+common = import_module(f"..{__package__.rpartition('.')[2].replace('suggest', 'common', 1)}.common", __package__)
+
+VOTES = {
+    "approve": "<:Approve:818120227387998258>",
+    "neutral": "<:Neutral:818120929057046548>",
+    "disapprove": "<:Disapprove:818120194135425024>"
+}
+
+
+# value -> (emoji, label)
+CATEGORIES = {
+    "discord": ("<:Discord:795240449103233024>", "Discord Suggestion"),
+    "hotel": ("🏨", "Hotel Suggestion"),
+    "training": ("<:studio:639558945584840743>", "Training Center Suggestion")
+}
+
+# Suggestion channels of the guild that was set up before routes were configurable
+DEFAULT_ROUTES = {
+    686214712354144387: {"discord": 686858225743822883, "hotel": 777656824098062385, "training": 686253519350923280}
+}
+
+# MinHash signature length, split in LSH_BANDS bands of LSH_ROWS hashes. Two suggestions with
+# similarity s share a bucket with probability 1 - (1 - s^LSH_ROWS)^LSH_BANDS, about 0.99 at the
+# 0.3 threshold. Less similar pairs that still share one are dropped by the signature estimate.
+MINHASH_PERMUTATIONS = 96
+LSH_BANDS = 48
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+# Estimated similarity from which a suggestion is shown as similar
+SIMILAR_THRESHOLD = 0.3
+SIMILAR_SHOWN = 3
+# One extendable-output digest per shingle gives all of its hashes at once
+HASH_FORMAT = struct.Struct(f"<{MINHASH_PERMUTATIONS}I")
+
+STOPWORDS = frozenset("a an and are be can could for i in is it of on or please should so that the there this to we would you your".split())
+
+# Seconds between writing changed tallies to the database
+FLUSH_INTERVAL = 30
+
+
+class SuggestionTally:
+    """
+    Votes on one suggestion, kept in memory and written back in batches.
+    """
+
+    __slots__ = ("message_id", "guild_id", "channel_id", "author_id", "text", "votes", "counts")
+
+    def __init__(self, message_id, guild_id, channel_id, author_id=None, text="", votes=None):
+        self.message_id = message_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.text = text
+        self.votes = votes or {}
+        self.counts = dict.fromkeys(VOTES, 0)
+        for vote in self.votes.values():
+            self.counts[vote] += 1
+
+    @property
+    def score(self):
+        return self.counts["approve"] - self.counts["disapprove"]
+
+    @property
+    def rank_key(self):
+        # Highest score first, newer suggestions first on ties
+        return (-self.score, -self.message_id)
+
+    @classmethod
+    def from_doc(cls, doc):
+        votes = {int(user): vote for user, vote in doc.get("votes", {}).items()}
+        return cls(doc["message_id"], doc["guild_id"], doc["channel_id"], doc.get("author_id"), doc.get("text", ""), votes)
+
+    def to_doc(self):
+        return {
+            "message_id": self.message_id,
+            "guild_id": self.guild_id,
+            "channel_id": self.channel_id,
+            "author_id": self.author_id,
+            "text": self.text,
+            "votes": {str(user): vote for user, vote in self.votes.items()},
+            "score": self.score
+        }
+
+
+def shingles(text):
+    """Words and word pairs of a suggestion, without stopwords."""
+    words = [w for w in re.findall(r"[a-z0-9']+", text.lower()) if w not in STOPWORDS]
+    grams = set(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return grams
+
+
+def minhash(text):
+    rows = [HASH_FORMAT.unpack(hashlib.shake_128(x.encode()).digest(HASH_FORMAT.size)) for x in shingles(text)]
+    if not rows:
+        return None
+    return tuple(map(min, zip(*rows)))
+
+
+class SimilarityIndex:
+    """
+    MinHash signatures of every suggestion, bucketed by LSH band so only suggestions that
+    share a bucket with the new one are compared.
+    """
+
+    def __init__(self):
+        self.signatures = {}  # message id -> (guild id, signature)
+        self.buckets = defaultdict(set)  # (guild id, band, band hashes) -> message ids
+
+    def add(self, message_id, guild_id, text):
+        signature = minhash(text)
+        if signature is None or message_id in self.signatures:
+            return
+        self.signatures[message_id] = (guild_id, signature)
+        for band in range(LSH_BANDS):
+            self.buckets[(guild_id, band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])].add(message_id)
+
+    def similar(self, guild_id, text, limit=SIMILAR_SHOWN):
+        """Returns up to limit (estimated similarity, message id) of the most similar suggestions."""
+        signature = minhash(text)
+        if signature is None:
+            return []
+        candidates = set()
+        for band in range(LSH_BANDS):
+            candidates |= self.buckets.get((guild_id, band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]), set())
+        scored = []
+        for message_id in candidates:
+            other = self.signatures[message_id][1]
+            score = sum(x == y for x, y in zip(signature, other)) / MINHASH_PERMUTATIONS
+            if score >= SIMILAR_THRESHOLD:
+                scored.append((score, message_id))
+        scored.sort(reverse=True)
+        return scored[:limit]
+
+
+class VoteView(discord.ui.View):
+    """
+    Persistent voting buttons for every suggestion, votes are looked up by message ID when clicked.
+    """
+
+    def __init__(self, cog, counts=None):
+        super().__init__(timeout=None)
+        self.cog = cog
+        counts = counts or {}
+        for vote, emoji in VOTES.items():
+            button = discord.ui.Button(
+                emoji=emoji,
+                label=str(counts.get(vote, 0)),
+                style=discord.ButtonStyle.secondary,
+                custom_id=f"suggest:{vote}"
+            )
+            button.callback = self.make_callback(vote)
+            self.add_item(button)
+
+    def make_callback(self, vote):
+        async def callback(interaction: discord.Interaction):
+            await self.cog.vote(interaction, vote)
+        return callback
+
+
+class CategoryView(discord.ui.View):
+    """
+    Lets the author pick where their suggestion is sent.
+    """
+
+    def __init__(self, cog, ctx, suggestEmbed, channels):
+        super().__init__(timeout=60)
+        self.cog = cog
+        self.ctx = ctx
+        self.suggestEmbed = suggestEmbed
+        self.channels = channels
+        self.message = None
+        self.category_select.options = [
+            discord.SelectOption(label=label, value=value, emoji=emoji)
+            for value, (emoji, label) in CATEGORIES.items() if value in channels
+        ]
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.ctx.author.id:
+            await interaction.response.send_message("This isn't your suggestion.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.select(placeholder="Select the type of your suggestion...")
+    async def category_select(self, interaction: discord.Interaction, select: discord.ui.Select):
+        self.stop()
+        channel = self.channels[select.values[0]]
+        sugmsg = await channel.send(content=f"<@!{self.ctx.author.id}>", embed=self.suggestEmbed, view=self.cog.vote_view())
+        self.cog.add_suggestion(SuggestionTally(sugmsg.id, self.ctx.guild.id, channel.id, self.ctx.author.id, self.suggestEmbed.description))
+        editEmbed = self.cog.templates.get("sent", description=f"✅ | Successfully sent your suggestion to <#{channel.id}>")
+        await interaction.response.edit_message(embed=editEmbed, view=None)
+
+    @discord.ui.button(label="Cancel", emoji="❌", style=discord.ButtonStyle.secondary)
+    async def cancel_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
+        editEmbed = self.cog.templates.template("cancel")
+        await interaction.response.edit_message(embed=editEmbed, view=None)
+
+    async def on_timeout(self):
+        embedTimeout = self.cog.templates.template("timeout")
+        await self.message.edit(embed=embedTimeout, view=None)
 
 
 class Suggest(commands.Cog):
@@ -13,10 +222,196 @@ class Suggest(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.coll = bot.plugin_db.get_partition(self)
+        self.tallies = {}  # message id -> SuggestionTally
+        self.rankings = defaultdict(list)  # guild id -> sorted rank keys
+        self.dirty = set()
+        self.cooldowns = common.cooldown_backend()
+        self.routes = {}  # guild id -> {category: channel id}
+        self.channels = {}  # channel id -> resolved channel
+        self.similar = SimilarityIndex()
+        self.templates = common.EmbedTemplates()
+        self.templates.register("prompt", self.prompt_embed)
+        self.templates.register("suggestion", self.suggestion_embed)
+        self.templates.register("sent", lambda guild_id, color: discord.Embed(color=3066993))
+        self.templates.register("cancel", lambda guild_id, color: discord.Embed(description="❌ | Cancelled command.", color=15158332))
+        self.templates.register("timeout", lambda guild_id, color: discord.Embed(description="❌ | You took too long! Command cancelled", color=15158332))
+
+    async def cog_load(self):
+        async for doc in self.coll.find({"routes": {"$exists": True}}):
+            self.routes[doc["guild_id"]] = doc["routes"]
+        async for doc in self.coll.find({"message_id": {"$exists": True}}):
+            self.add_suggestion(SuggestionTally.from_doc(doc), dirty=False)
+            if len(self.tallies) % 50 == 0:
+                await asyncio.sleep(0)  # Hashing every suggestion shouldn't hold up the rest of the bot
+        self.bot.add_view(VoteView(self))
+        self.flush_votes.start()
+
+    async def cog_unload(self):
+        self.flush_votes.cancel()
+        await self.write_tallies()
+        self.cooldowns.close()
+
+    def add_suggestion(self, tally, dirty=True):
+        self.tallies[tally.message_id] = tally
+        insort(self.rankings[tally.guild_id], tally.rank_key)
+        self.similar.add(tally.message_id, tally.guild_id, tally.text)
+        if dirty:
+            self.dirty.add(tally.message_id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.channels.pop(channel.id, None)
+        self.templates.invalidate(channel.guild.id)
+
+    def suggestion_channels(self, guild_id):
+        """Returns the resolved channel of every category that is set up in the guild."""
+        routes = self.routes.get(guild_id) or DEFAULT_ROUTES.get(guild_id, {})
+        channels = {}
+        for category, channel_id in routes.items():
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                channel = self.bot.get_channel(channel_id)
+                if channel is None:
+                    continue
+                self.channels[channel_id] = channel
+            channels[category] = channel
+        return channels
 
     @commands.command()
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def suggestchannel(self, ctx, category: str.lower, channel: discord.TextChannel):
+        """
+        Set the channel a suggestion category of this server is sent to.
+
+        **Usage**:
+        -suggestchannel hotel #hotel-suggestions
+        """
+        if category not in CATEGORIES:
+            return await ctx.send(f"The category has to be one of: {', '.join(f'`{x}`' for x in CATEGORIES)}.")
+        routes = dict(self.routes.get(ctx.guild.id) or DEFAULT_ROUTES.get(ctx.guild.id, {}))
+        old = routes.get(category)
+        routes[category] = channel.id
+        await self.coll.update_one(
+            {"_id": f"config:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, "routes": routes}},
+            upsert=True
+        )
+        self.routes[ctx.guild.id] = routes
+        self.channels.pop(old, None)
+        self.templates.invalidate(ctx.guild.id)
+        await ctx.send(f"{CATEGORIES[category][1]}s will now be sent in {channel.mention}.")
+
+    def prompt_embed(self, guild_id, color):
+        channels = self.suggestion_channels(guild_id)
+        texta = "**Select the type of your suggestion:**\n" + "\n".join(
+            f"  {emoji} | {label}" for value, (emoji, label) in CATEGORIES.items() if value in channels
+        ) + "\n  ❌ | Cancel Command"
+        return discord.Embed(description=texta, color=color)
+
+    def suggestion_embed(self, guild_id, color):
+        suggestEmbed = discord.Embed(color=color)
+        suggestEmbed.set_footer(text="Vinns Hotel Suggestions | -suggest")
+        return suggestEmbed
+
+    def vote_view(self, counts=None):
+        return common.render_only(VoteView(self, counts))
+
+    async def vote(self, interaction, vote):
+        message = interaction.message
+        tally = self.tallies.get(message.id)
+        if tally is None:
+            # Suggestions posted before votes were tracked
+            tally = SuggestionTally(message.id, message.guild.id, message.channel.id)
+            self.add_suggestion(tally)
+
+        previous = tally.votes.get(interaction.user.id)
+        if previous != vote:
+            ranking = self.rankings[tally.guild_id]
+            del ranking[bisect_left(ranking, tally.rank_key)]
+            if previous is not None:
+                tally.counts[previous] -= 1
+            tally.counts[vote] += 1
+            tally.votes[interaction.user.id] = vote
+            insort(ranking, tally.rank_key)
+            self.dirty.add(tally.message_id)
+        await interaction.response.edit_message(view=self.vote_view(tally.counts))
+
+    async def write_tallies(self):
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, set()
+        ops = [
+            UpdateOne({"_id": f"suggestion:{x}"}, {"$set": self.tallies[x].to_doc()}, upsert=True)
+            for x in dirty
+        ]
+        try:
+            await self.coll.bulk_write(ops, ordered=False)
+        except Exception as e:
+            self.dirty |= dirty
+            print(f"Failed to write {len(ops)} suggestion tallies: {e}")
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_votes(self):
+        await self.write_tallies()
+
+    @commands.group(invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.REGULAR)
+    async def suggestions(self, ctx):
+        """
+        Browse the suggestions of this server.
+        """
+        await ctx.send_help(ctx.command)
+
+    @suggestions.command(name="top")
     @checks.has_permissions(PermissionLevel.REGULAR)
-    @commands.cooldown(1, 30, commands.BucketType.user)
+    async def suggestions_top(self, ctx, limit: int = 10):
+        """
+        Show the highest voted suggestions.
+        """
+        ranking = self.rankings.get(ctx.guild.id)
+        if not ranking:
+            return await ctx.send("There are no suggestions yet.")
+        lines = []
+        for _, negative_id in ranking[:max(1, min(limit, 25))]:
+            tally = self.tallies[-negative_id]
+            text = tally.text if len(tally.text) <= 80 else tally.text[:77] + "..."
+            lines.append(
+                f"**{tally.score:+}** ({tally.counts['approve']}/{tally.counts['neutral']}/{tally.counts['disapprove']}) "
+                f"[Jump](https://discord.com/channels/{tally.guild_id}/{tally.channel_id}/{tally.message_id}) {text}"
+            )
+        embed = discord.Embed(title="Top Suggestions", description="\n".join(lines), color=self.bot.main_color)
+        await ctx.send(embed=embed)
+
+    @suggestions.command(name="backfill")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def suggestions_backfill(self, ctx, limit: int = None):
+        """
+        Index the suggestions in this server's suggestion channels that were sent before they were tracked.
+        """
+        channels = self.suggestion_channels(ctx.guild.id)
+        if not channels:
+            return await ctx.send("Suggestions aren't set up in this server.")
+        progress = await ctx.send("Reading the suggestion channels...")
+        added = 0
+        for channel in set(channels.values()):
+            # History is streamed page by page, nothing but the new tallies is kept
+            async for message in channel.history(limit=limit, oldest_first=True):
+                if message.author.id != self.bot.user.id or not message.embeds or message.id in self.tallies:
+                    continue
+                text = message.embeds[0].description
+                if not text:
+                    continue
+                author_id = message.raw_mentions[0] if message.raw_mentions else None
+                self.add_suggestion(SuggestionTally(message.id, ctx.guild.id, channel.id, author_id, text))
+                added += 1
+                if added % 100 == 0:
+                    await progress.edit(content=f"Indexed {added} suggestions, still reading {channel.mention}...")
+        await self.write_tallies()
+        await progress.edit(content=f"Indexed {added} older suggestions.")
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.REGULAR)
+    @common.shared_cooldown(30)
     async def suggest(self, ctx, *, suggestion):
         """
         Suggest something!
@@ -25,54 +420,23 @@ class Suggest(commands.Cog):
         -suggest You should add cars so guest can be driven to their rooms.
         """
         try:
-            if ctx.guild.id == 686214712354144387:
-                discChannel = self.bot.get_channel(686858225743822883)
-                trainingChannel = self.bot.get_channel(686253519350923280)
-                hotelChannel = self.bot.get_channel(777656824098062385)
-                texta = """**React with the type of your suggestion:**
-  <:Discord:795240449103233024> | Discord Suggestion
-  🏨 | Hotel Suggestion
-  <:studio:639558945584840743> | Training Center Suggestion
-  ❌ | Cancel Command"""
-                embed1 = discord.Embed(description=texta, color=self.bot.main_color)
-                reactionmsg = await ctx.send(content=f"<@!{ctx.author.id}>", embed=embed1)
-                for emoji in ('<:Discord:795240449103233024>', '🏨', '<:studio:639558945584840743>', '❌'):
-                    await reactionmsg.add_reaction(emoji)
-                suggestEmbed = discord.Embed(description=suggestion, color=self.bot.main_color)
-                suggestEmbed.set_footer(text="Vinns Hotel Suggestions | -suggest")
-                suggestEmbed.set_author(name=ctx.author, icon_url=ctx.author.avatar.url)
-                embedTimeout = discord.Embed(description="❌ | You took too long! Command cancelled", color=15158332)
-
-                def check(r, u):
-                    return u == ctx.author
-
-                try:
-                    reaction, user = await self.bot.wait_for("reaction_add", check=check, timeout=60)
-                except asyncio.TimeoutError:
-                    await reactionmsg.edit(embed=embedTimeout)
-                if str(reaction.emoji) == '<:Discord:795240449103233024>':
-                    sugmsg = await discChannel.send(content=f"<@!{user.id}>", embed=suggestEmbed)
-                    editEmbed = discord.Embed(description=f"✅ | Successfully sent your suggestion to <#{discChannel.id}>",
-                                              color=3066993)
-                    await reactionmsg.edit(embed=editEmbed)
-                if str(reaction.emoji) == '🏨':
-                    sugmsg = await hotelChannel.send(content=f"<@!{user.id}>", embed=suggestEmbed)
-                    editEmbed = discord.Embed(description=f"✅ | Successfully sent your suggestion to <#{hotelChannel.id}>",
-                                              color=3066993)
-                    await reactionmsg.edit(embed=editEmbed)
-
-                if str(reaction.emoji) == '<:studio:639558945584840743>':
-                    sugmsg = await trainingChannel.send(content=f"<@!{user.id}>", embed=suggestEmbed)
-                    editEmbed = discord.Embed(
-                        description=f"✅ | Successfully sent your suggestion to <#{trainingChannel.id}>", color=3066993)
-                    await reactionmsg.edit(embed=editEmbed)
-                if str(reaction.emoji) == '❌':
-                    editEmbed = discord.Embed(description="❌ | Cancelled command.", color=15158332)
-                    await reactionmsg.edit(embed=editEmbed)
-                await reactionmsg.clear_reactions()
-                for emoji in (
-                '<:Approve:818120227387998258>', '<:Neutral:818120929057046548>', '<:Disapprove:818120194135425024>'):
-                    await sugmsg.add_reaction(emoji)
+            channels = self.suggestion_channels(ctx.guild.id)
+            if not channels:
+                return await ctx.send("Suggestions aren't set up in this server.")
+            embed1 = self.templates.get("prompt", ctx.guild.id, self.bot.main_color)
+            similar = self.similar.similar(ctx.guild.id, suggestion)
+            if similar:
+                lines = []
+                for score, message_id in similar:
+                    tally = self.tallies[message_id]
+                    text = tally.text if len(tally.text) <= 80 else tally.text[:77] + "..."
+                    lines.append(f"[{score:.0%}](https://discord.com/channels/{tally.guild_id}/{tally.channel_id}/{message_id}) {text}")
+                embed1.description = "**Similar suggestions already exist, check them before sending yours:**\n" + "\n".join(lines) + "\n\n" + embed1.description
+            suggestEmbed = self.templates.get("suggestion", color=self.bot.main_color, description=suggestion)
+            suggestEmbed.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
+
+            view = CategoryView(self, ctx, suggestEmbed, channels)
+            view.message = await ctx.send(content=f"<@!{ctx.author.id}>", embed=embed1, view=view)
         except discord.ext.commands.CommandOnCooldown:
             print("cooldown")
 
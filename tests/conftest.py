@@ -0,0 +1,76 @@
+import asyncio
+import enum
+import inspect
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+from fakes import ApiRecorder, FakeBot
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def install_core():
+    """Modmail's core package, the plugins only use its permission decorator and levels from it."""
+    core = types.ModuleType("core")
+    checks = types.ModuleType("core.checks")
+    models = types.ModuleType("core.models")
+
+    # Permission levels are checked by modmail itself, the tests call the commands directly
+    checks.has_permissions = lambda level: lambda func: func
+
+    class PermissionLevel(enum.IntEnum):
+        OWNER = 5
+        ADMINISTRATOR = 4
+        ADMIN = 4
+        MODERATOR = 3
+        MOD = 3
+        SUPPORTER = 2
+        RESPONDER = 2
+        REGULAR = 1
+        INVALID = -1
+
+    class DummyMessage:
+        def __init__(self, message):
+            self._message = message
+
+    models.PermissionLevel = PermissionLevel
+    models.DummyMessage = DummyMessage
+    core.checks = checks
+    core.models = models
+    sys.modules.update({"core": core, "core.checks": checks, "core.models": models})
+
+
+def install_plugins():
+    """Makes every plugin folder importable as plugins.@local.<name>, where modmail puts local plugins."""
+    plugins = types.ModuleType("plugins")
+    plugins.__path__ = []
+    local = types.ModuleType("plugins.@local")
+    local.__path__ = [str(ROOT)]
+    sys.modules.update({"plugins": plugins, "plugins.@local": local})
+
+
+install_core()
+install_plugins()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    # Every test gets a fresh event loop, no async plugin is needed
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        args = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+        asyncio.run(pyfuncitem.obj(**args))
+        return True
+    return None
+
+
+@pytest.fixture
+def api():
+    return ApiRecorder()
+
+
+@pytest.fixture
+def bot(api):
+    return FakeBot(api)
@@ -0,0 +1,430 @@
+"""
+Offline stand-ins for the bot, the plugin database and the Discord objects the plugins touch.
+Every call that would reach the Discord API is recorded by an ApiRecorder and takes one
+simulated round trip, so a test can check how many calls a flow makes and how long it waits.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import re
+import time
+from types import SimpleNamespace
+
+import discord
+from pymongo.errors import DuplicateKeyError
+
+# Simulated time one Discord API request takes
+ROUND_TRIP = 0.05
+
+ids = itertools.count(1_100_000_000_000_000_000)
+
+
+class ApiRecorder:
+    """
+    Records every outbound API call in order. A call is (name, fields), like
+    ("channel.send", {"channel": 1, "embed": ...}).
+    """
+
+    def __init__(self, latency=ROUND_TRIP):
+        self.latency = latency
+        self.calls = []
+
+    async def call(self, name, /, **fields):
+        self.calls.append((name, fields))
+        await asyncio.sleep(self.latency)
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+    def last(self, name):
+        """Returns the fields of the latest call with this name."""
+        return next(fields for call, fields in reversed(self.calls) if call == name)
+
+    def reset(self):
+        self.calls = []
+
+    async def measure(self, awaitable):
+        """Runs one step of a flow from an empty record, returns how many round trips it took."""
+        self.reset()
+        start = time.perf_counter()
+        await awaitable
+        return (time.perf_counter() - start) / self.latency
+
+
+@contextlib.asynccontextmanager
+async def loaded(cog):
+    # Commands are bound to their cog by bot.add_cog, which a FakeBot doesn't have
+    for command in cog.walk_commands():
+        command.cog = cog
+    await cog.cog_load()
+    try:
+        yield cog
+    finally:
+        await discord.utils.maybe_coroutine(cog.cog_unload)
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, x) for x in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict) and any(op.startswith("$") for op in cond):
+            for op, arg in cond.items():
+                if op == "$exists":
+                    ok = (key in doc) == arg
+                elif op == "$in":
+                    ok = value in arg or (isinstance(value, list) and any(x in arg for x in value))
+                elif op == "$regex":
+                    ok = isinstance(value, str) and re.search(arg, value) is not None
+                elif value is None:
+                    ok = False
+                else:
+                    ok = {"$lt": value < arg, "$lte": value <= arg, "$gt": value > arg, "$gte": value >= arg}[op]
+                if not ok:
+                    return False
+        elif isinstance(value, list) and not isinstance(cond, list):
+            if cond not in value:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def set_path(doc, path, value):
+    *parents, last = path.split(".")
+    for key in parents:
+        doc = doc.setdefault(key, {})
+    doc[last] = value
+
+
+def apply_update(doc, update):
+    for path, value in update.get("$set", {}).items():
+        set_path(doc, path, value)
+    for path, value in update.get("$inc", {}).items():
+        doc[path] = doc.get(path, 0) + value
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        keys = [(key, direction)] if isinstance(key, str) else list(key)
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field)), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """
+    The subset of an async Mongo collection the plugins use, kept in a dict by _id.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.indexes = []
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+
+    def find(self, query=None):
+        return FakeCursor([dict(doc) for doc in self.docs.values() if matches(doc, query or {})])
+
+    async def find_one(self, query):
+        return next((dict(doc) for doc in self.docs.values() if matches(doc, query)), None)
+
+    async def insert_one(self, doc):
+        doc = dict(doc)
+        doc.setdefault("_id", next(ids))
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']}")
+        self.docs[doc["_id"]] = doc
+
+    async def update_one(self, query, update, upsert=False):
+        doc = next((doc for doc in self.docs.values() if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            if doc["_id"] in self.docs:
+                raise DuplicateKeyError(f"duplicate _id {doc['_id']}")
+            self.docs[doc["_id"]] = doc
+        apply_update(doc, update)
+
+    async def find_one_and_update(self, query, update, return_document=False):
+        doc = next((doc for doc in self.docs.values() if matches(doc, query)), None)
+        if doc is None:
+            return None
+        before = dict(doc)
+        apply_update(doc, update)
+        return dict(doc) if return_document else before
+
+    async def find_one_and_delete(self, query):
+        doc = next((doc for doc in self.docs.values() if matches(doc, query)), None)
+        if doc is not None:
+            del self.docs[doc["_id"]]
+        return doc
+
+    async def delete_one(self, query):
+        doc = await self.find_one_and_delete(query)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query):
+        for doc in [doc for doc in self.docs.values() if matches(doc, query)]:
+            del self.docs[doc["_id"]]
+
+    async def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            await self.update_one(op._filter, op._doc, upsert=op._upsert)
+
+
+class FakeMessage(discord.Message):
+    """A sent message, or a partial one when only its channel and ID are known."""
+
+    def __init__(self, channel, id=None, author=None, content=None, embeds=(), attachments=(), reference=None, mentions=()):
+        self.id = next(ids) if id is None else id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content or ""
+        self.embeds = list(embeds)
+        self.attachments = list(attachments)
+        self.reference = reference
+        self.mentions = list(mentions)
+
+    async def edit(self, **fields):
+        await self.channel.api.call("message.edit", channel=self.channel.id, message=self.id, **fields)
+        return self
+
+    async def delete(self):
+        await self.channel.api.call("message.delete", channel=self.channel.id, message=self.id)
+
+    async def create_thread(self, name):
+        await self.channel.api.call("message.create_thread", channel=self.channel.id, message=self.id, name=name)
+        return self.guild.add_channel(self.id, parent=self.channel)
+
+
+class FakeChannel:
+    def __init__(self, api, guild, id, parent=None):
+        self.api = api
+        self.guild = guild
+        self.id = id
+        self.parent = parent
+        self.mention = f"<#{id}>"
+
+    async def send(self, content=None, **fields):
+        await self.api.call("channel.send", channel=self.id, content=content, **fields)
+        return FakeMessage(self, author=self.guild.me, content=content, embeds=[fields["embed"]] if fields.get("embed") else ())
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self, message_id)
+
+    async def delete_messages(self, messages):
+        await self.api.call("channel.delete_messages", channel=self.id, messages=[x.id for x in messages])
+
+
+class FakeGuild:
+    def __init__(self, api, id, name="Vinns Hotels"):
+        self.api = api
+        self.id = id
+        self.name = name
+        self.channels = {}
+        self.threads = {}
+        self.me = FakeMember(self, next(ids), "Modmail", bot=True)
+
+    def __str__(self):
+        return self.name
+
+    def add_channel(self, id=None, parent=None):
+        channel = FakeChannel(self.api, self, next(ids) if id is None else id, parent)
+        (self.threads if parent else self.channels)[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_thread(self, thread_id):
+        return self.threads.get(thread_id)
+
+    async def fetch_channel(self, channel_id):
+        await self.api.call("guild.fetch_channel", channel=channel_id)
+        return self.channels.get(channel_id) or self.threads[channel_id]
+
+
+class FakeMember:
+    def __init__(self, guild, id, name, roles=(), bot=False, permissions=()):
+        self.guild = guild
+        self.id = id
+        self.name = name
+        self.nick = None
+        self.bot = bot
+        self.roles = [SimpleNamespace(id=x) for x in roles]
+        self.guild_permissions = discord.Permissions(**dict.fromkeys(permissions, True))
+        self.mention = f"<@{id}>"
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.discordapp.com/avatars/{id}.png")
+
+    def __str__(self):
+        return self.name
+
+
+class FakeResponse:
+    """interaction.response, only one of its methods may be used per interaction."""
+
+    def __init__(self, api):
+        self.api = api
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def respond(self, name, **fields):
+        assert not self.done, "the interaction was already responded to"
+        self.done = True
+        await self.api.call(name, **fields)
+
+    async def send_message(self, content=None, **fields):
+        await self.respond("interaction.send_message", content=content, **fields)
+
+    async def defer(self, **fields):
+        await self.respond("interaction.defer", **fields)
+
+    async def edit_message(self, **fields):
+        await self.respond("interaction.edit_message", **fields)
+
+    async def send_modal(self, modal):
+        await self.respond("interaction.send_modal", modal=modal)
+
+
+class FakeFollowup:
+    def __init__(self, api, channel):
+        self.api = api
+        self.channel = channel
+
+    async def send(self, content=None, **fields):
+        await self.api.call("interaction.followup", content=content, **fields)
+        return FakeMessage(self.channel, author=self.channel.guild.me, content=content)
+
+
+class FakeInteraction:
+    def __init__(self, api, user, message):
+        self.user = user
+        self.message = message
+        self.guild = message.guild
+        self.channel = message.channel
+        self.response = FakeResponse(api)
+        self.followup = FakeFollowup(api, message.channel)
+
+
+class FakeContext:
+    def __init__(self, api, author, channel, prefix="-"):
+        self.api = api
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.prefix = prefix
+        self.message = FakeMessage(channel, author=author)
+
+    async def send(self, content=None, **fields):
+        return await self.channel.send(content, **fields)
+
+
+class FakeAttachment:
+    def __init__(self, data, filename="proof.png", content_type="image/png"):
+        self.data = data
+        self.id = next(ids)
+        self.filename = filename
+        self.content_type = content_type
+        self.size = len(data)
+        self.url = f"https://cdn.discordapp.com/attachments/{self.id}/{filename}"
+
+    def is_spoiler(self):
+        return False
+
+
+class FakeDownload:
+    def __init__(self, api, data):
+        self.api = api
+        self.content = SimpleNamespace(iter_chunked=self.iter_chunked)
+        self.data = data
+
+    async def __aenter__(self):
+        # Attachments come from the CDN, which isn't rate limited like the API
+        await asyncio.sleep(self.api.latency)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.data), size):
+            yield self.data[i:i + size]
+
+
+class FakeHTTPSession:
+    def __init__(self, api):
+        self.api = api
+        self.files = {}  # url -> bytes
+        self.downloads = []
+
+    def get(self, url):
+        self.downloads.append(url)
+        return FakeDownload(self.api, self.files[url])
+
+
+class FakeBot:
+    def __init__(self, api):
+        self.api = api
+        self.main_color = 0x7289DA
+        self.guilds = {}
+        self.views = []
+        self.events = []
+        self.partitions = {}
+        self.plugin_db = SimpleNamespace(get_partition=self.get_partition)
+        self.session = FakeHTTPSession(api)
+        self.user = SimpleNamespace(id=next(ids), name="Modmail")
+        self.ready = asyncio.Event()
+
+    @property
+    def loop(self):
+        return asyncio.get_running_loop()
+
+    def get_partition(self, cog):
+        return self.partitions.setdefault(type(cog).__name__, FakeCollection())
+
+    def add_guild(self, id):
+        guild = self.guilds[id] = FakeGuild(self.api, id)
+        return guild
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        for guild in self.guilds.values():
+            channel = guild.get_channel(channel_id) or guild.get_thread(channel_id)
+            if channel is not None:
+                return channel
+        return None
+
+    def add_view(self, view):
+        self.views.append(view)
+
+    def dispatch(self, event, *args):
+        self.events.append((event, args))
+
+    async def wait_until_ready(self):
+        # Background loops stay parked, the tests run every step themselves
+        await self.ready.wait()
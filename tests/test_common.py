@@ -0,0 +1,34 @@
+import asyncio
+from importlib import import_module
+
+from fakes import ROUND_TRIP
+
+common = import_module("plugins.@local.common.common")
+
+GUILD = 686214712354144387
+
+
+async def test_edit_coalescer_sends_the_first_edit_at_once(bot, api):
+    channel = bot.add_guild(GUILD).add_channel()
+    message = channel.get_partial_message(1)
+    edits = common.EditCoalescer()
+
+    # A lone edit goes out right away
+    round_trips = await api.measure(edits.edit(message, content="first"))
+    assert api.names() == ["message.edit"]
+    assert round_trips < 1.5
+
+    # Edits inside the window after it are merged into one, sent when the window is over
+    round_trips = await api.measure(asyncio.gather(
+        edits.edit(message, content="second"),
+        edits.edit(message, content="third", embed=None)
+    ))
+    assert api.names() == ["message.edit"]
+    assert api.last("message.edit")["content"] == "third" and "embed" in api.last("message.edit")
+    assert round_trips < edits.window / ROUND_TRIP + 1.5
+
+    # Once the window has passed, the next edit goes out right away again
+    await asyncio.sleep(edits.window + ROUND_TRIP)
+    assert not edits.tasks
+    round_trips = await api.measure(edits.edit(message, content="fourth"))
+    assert round_trips < 1.5
@@ -0,0 +1,96 @@
+import asyncio
+from importlib import import_module
+
+from fakes import FakeMember, FakeMessage, loaded
+
+detect = import_module("plugins.@local.detect.detect")
+
+GUILD = 686214712354144387
+WINDOW = 0.3
+BURST = 3
+
+
+async def test_chairman_ping(bot, api):
+    guild = bot.add_guild(GUILD)
+    channel = guild.add_channel()
+    members = [FakeMember(guild, 1001 + i, f"guest{i}") for i in range(5)]
+    async with loaded(detect.botPing(bot)) as cog:
+        cog.ping_throttle[guild.id] = (WINDOW, BURST)
+
+        # Messages that don't ping the chairman cost nothing
+        await api.measure(cog.on_message(FakeMessage(channel, author=members[0], content="Is anyone hosting a training?")))
+        assert api.names() == []
+
+        # One warning per ping, in a single round trip
+        round_trips = await api.measure(cog.on_message(FakeMessage(channel, author=members[0], content=f"<@{detect.CHAIRMAN_ID}> hi")))
+        assert api.names() == ["channel.send"]
+        assert round_trips < 1.5
+
+        # At most the burst is sent per window, the rest is folded into one warning once the window frees up
+        for member in members[1:] + members[:1]:
+            await cog.on_message(FakeMessage(channel, author=member, content=f"<@!{detect.CHAIRMAN_ID}>"))
+        assert api.names() == ["channel.send"] * BURST
+        await asyncio.sleep(WINDOW)
+        assert api.names() == ["channel.send"] * (BURST + 1)
+        assert api.calls[-1][1]["content"] == " ".join(f"<@!{x.id}>" for x in members[BURST:])
+        assert cog.ping_stats[guild.id]["suppressed"] == 1
+
+
+async def test_alias_is_a_ping(bot, api):
+    guild = bot.add_guild(GUILD)
+    channel = guild.add_channel()
+    member = FakeMember(guild, 1001, "guest")
+    async with loaded(detect.botPing(bot)) as cog:
+        # Guilds without aliases or banned phrases have no automaton, mentions are all they check
+        assert guild.id not in cog.automata
+        await cog.save_aliases(guild.id, {"vinns": detect.CHAIRMAN_ID})
+        assert guild.id in cog.automata
+
+        await api.measure(cog.on_message(FakeMessage(channel, author=member, content="Where is Vinnsville?")))
+        assert api.names() == []
+        await api.measure(cog.on_message(FakeMessage(channel, author=member, content="Where is Vinns?")))
+        assert api.names() == ["channel.send"]
+
+
+async def test_banned_phrase_is_flagged(bot, api):
+    guild = bot.add_guild(GUILD)
+    channel, log = guild.add_channel(), guild.add_channel()
+    member = FakeMember(guild, 1001, "guest")
+    staff = FakeMember(guild, 1002, "staff", permissions=["manage_messages"])
+    async with loaded(detect.botPing(bot)) as cog:
+        await cog.save_phrases(guild.id, {"free robux"})
+
+        # Without a log channel or deletion the message is only counted
+        await api.measure(cog.on_message(FakeMessage(channel, author=member, content="Free Robux here")))
+        assert api.names() == []
+        assert cog.ping_stats[guild.id]["flagged"] == 1
+
+        # With a log channel it is posted there, and only deleted once the guild opted in
+        cog.phrase_logs[guild.id] = log.id
+        await api.measure(cog.on_message(FakeMessage(channel, author=member, content="free robux here")))
+        assert api.names() == ["channel.send"]
+        assert api.last("channel.send")["channel"] == log.id
+
+        cog.phrase_deletes.add(guild.id)
+        await api.measure(cog.on_message(FakeMessage(channel, author=member, content="free robux here")))
+        assert api.names() == ["message.delete", "channel.send"]
+
+        # Staff are never deleted
+        await api.measure(cog.on_message(FakeMessage(channel, author=staff, content="don't post free robux links")))
+        assert api.names() == ["channel.send"]
+        assert cog.ping_stats[guild.id]["deleted"] == 1
+
+
+async def test_pending_warning_is_cancelled_on_unload(bot, api):
+    guild = bot.add_guild(GUILD)
+    channel = guild.add_channel()
+    members = [FakeMember(guild, 1001 + i, f"guest{i}") for i in range(BURST + 1)]
+    async with loaded(detect.botPing(bot)) as cog:
+        cog.ping_throttle[guild.id] = (WINDOW, BURST)
+        for member in members:
+            await cog.on_message(FakeMessage(channel, author=member, content=f"<@{detect.CHAIRMAN_ID}>"))
+        flush, = cog._flushes
+    await asyncio.sleep(0)
+    assert flush.cancelled()
+    await asyncio.sleep(WINDOW)
+    assert api.names() == ["channel.send"] * BURST
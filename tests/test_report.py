@@ -0,0 +1,101 @@
+import asyncio
+from importlib import import_module
+
+from fakes import FakeAttachment, FakeContext, FakeInteraction, FakeMember, FakeMessage, loaded
+
+report = import_module("plugins.@local.report.report")
+
+GUILD = 686214712354144387
+
+
+def setup_guild(bot):
+    guild = bot.add_guild(GUILD)
+    staff, guest = guild.add_channel(), guild.add_channel()
+    author = FakeMember(guild, 1001, "reporter")
+    return guild, staff, guest, author
+
+
+async def open_modal(api, cog, ctx, kind):
+    """Runs -report and picks the report type, returns the modal that was opened."""
+    await api.measure(cog.report(ctx))
+    assert api.names() == ["channel.send"]
+    view = api.last("channel.send")["view"]
+    button = view.staff_button if kind == "Staff" else view.guest_button
+    await api.measure(button.callback(FakeInteraction(api, ctx.author, view.message)))
+    assert api.names() == ["interaction.send_modal"]
+    return api.last("interaction.send_modal")["modal"]
+
+
+def fill(modal, username, reason, proof="", rank="Manager"):
+    modal.username._value = username
+    if modal.rank is not None:
+        modal.rank._value = rank
+    modal.reason._value = reason
+    modal.proof._value = proof
+
+
+async def test_report_with_proof_in_modal(bot, api):
+    guild, staff, guest, author = setup_guild(bot)
+    async with loaded(report.Reports(bot)) as cog:
+        cog.routes[guild.id] = {"staff": staff.id, "guest": guest.id}
+        ctx = FakeContext(api, author, guild.add_channel())
+
+        for kind, channel in (("Staff", staff), ("Guest", guest)):
+            modal = await open_modal(api, cog, ctx, kind)
+            fill(modal, f"{kind}Abuser", "Was rude to guests", proof="https://i.imgur.com/proof.png")
+            # The submit is acknowledged first, then the report is sent and the prompt edited
+            round_trips = await api.measure(modal.on_submit(FakeInteraction(api, author, modal.message)))
+            assert api.names() == ["interaction.defer", "channel.send", "message.edit"]
+            assert api.calls[1][1]["channel"] == channel.id
+            assert round_trips < 3.5
+
+
+async def test_report_with_uploaded_proof(bot, api):
+    guild, staff, guest, author = setup_guild(bot)
+    async with loaded(report.Reports(bot)) as cog:
+        cog.routes[guild.id] = {"staff": staff.id, "guest": guest.id}
+        ctx = FakeContext(api, author, guild.add_channel())
+        modal = await open_modal(api, cog, ctx, "Guest")
+        fill(modal, "Abuser", "Was rude to guests")
+
+        # Without proof the prompt asks for it in chat
+        submit = asyncio.create_task(api.measure(modal.on_submit(FakeInteraction(api, author, modal.message))))
+        while not cog.router.message_waits:
+            await asyncio.sleep(0)
+        assert api.names() == ["interaction.edit_message"]
+
+        attachment = FakeAttachment(b"\x89PNG" + bytes(4096))
+        bot.session.files[attachment.url] = attachment.data
+        api.reset()
+        await cog.on_message(FakeMessage(ctx.channel, author=author, content="Caught them", attachments=[attachment]))
+        await submit
+        # The proof is re-uploaded with the report, so the message it came in is removed
+        assert api.names() == ["message.delete", "channel.send", "message.edit"]
+        assert len(api.last("channel.send")["files"]) == 1
+        assert bot.session.downloads == [attachment.url]
+        assert ("attachment_download", attachment) == (bot.events[0][0], bot.events[0][1][0])
+
+
+async def test_duplicate_report_is_threaded(bot, api):
+    guild, staff, guest, author = setup_guild(bot)
+    async with loaded(report.Reports(bot)) as cog:
+        cog.routes[guild.id] = {"staff": staff.id, "guest": guest.id}
+        ctx = FakeContext(api, author, guild.add_channel())
+
+        modal = await open_modal(api, cog, ctx, "Guest")
+        fill(modal, "Abuser", "Was rude to guests", proof="https://i.imgur.com/1.png")
+        await modal.on_submit(FakeInteraction(api, author, modal.message))
+        original = api.last("channel.send")
+
+        modal = await open_modal(api, cog, ctx, "Guest")
+        fill(modal, "abuser", "Was rude to guests again", proof="https://i.imgur.com/2.png")
+        # The thread is created under the first report once, the report is sent in it
+        await api.measure(modal.on_submit(FakeInteraction(api, author, modal.message)))
+        assert api.names() == ["interaction.defer", "message.create_thread", "channel.send", "message.edit"]
+        thread = guild.get_thread(api.calls[1][1]["message"])
+        assert api.calls[2][1]["channel"] == thread.id
+        assert original["channel"] == guest.id
+
+        docs = [doc async for doc in cog.coll.find({"duplicate_of": {"$exists": True}}).sort("created_at", 1)]
+        assert docs[1]["channel_id"] == thread.id
+        assert docs[0]["duplicates"] == 1
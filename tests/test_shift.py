@@ -0,0 +1,56 @@
+from importlib import import_module
+
+from fakes import FakeContext, FakeInteraction, FakeMember, loaded
+
+shift = import_module("plugins.@local.shift.shift")
+
+HOME_GUILD = 686214712354144387
+OTHER_GUILD = 814758983238942720
+
+
+def setup_guilds(bot):
+    home = bot.add_guild(HOME_GUILD)
+    home.add_channel(shift.channel_id)
+    other = bot.add_guild(OTHER_GUILD)
+    host = FakeMember(home, 1001, "host", roles=[shift.ALLOWED_ROLES[0]])
+    return home, other, host
+
+
+async def test_shift_start_and_end(bot, api):
+    home, other, host = setup_guilds(bot)
+    async with loaded(shift.ShiftManager(bot)) as cog:
+        cog.shift_channel_ids[other.id] = other.add_channel().id
+        ctx = FakeContext(api, host, home.add_channel())
+
+        # Start: one announcement per guild, sent at once, then the confirmation
+        round_trips = await api.measure(cog.shift(ctx))
+        assert api.names() == ["channel.send"] * 3
+        assert round_trips < 2.5
+        session = next(iter(cog.sessions.values()))
+        assert len(session.copies) == 2
+
+        # End: the ephemeral answer, then every copy is edited at once from the cached session
+        channel_id, message_id = session.copies[0]
+        click = FakeInteraction(api, host, bot.get_channel(channel_id).get_partial_message(message_id))
+        round_trips = await api.measure(bot.views[0].end_button.callback(click))
+        assert api.names() == ["interaction.send_message", "message.edit", "message.edit"]
+        assert round_trips < 2.5
+        assert not cog.sessions
+
+        # The deferred deletion is a single call per copy, made in parallel
+        round_trips = await api.measure(cog.deletions.delete_due(sorted(cog.deletions.heap)))
+        assert api.names() == ["message.delete"] * 2
+        assert round_trips < 1.5
+
+
+async def test_shift_end_without_permission(bot, api):
+    home, other, host = setup_guilds(bot)
+    async with loaded(shift.ShiftManager(bot)) as cog:
+        await cog.shift(FakeContext(api, host, home.add_channel()))
+        channel_id, message_id = next(iter(cog.sessions.values())).copies[0]
+        guest = FakeMember(home, 1002, "guest")
+
+        click = FakeInteraction(api, guest, bot.get_channel(channel_id).get_partial_message(message_id))
+        await api.measure(bot.views[0].end_button.callback(click))
+        assert api.names() == ["interaction.send_message"]
+        assert cog.sessions
@@ -0,0 +1,40 @@
+from importlib import import_module
+
+from fakes import FakeContext, FakeInteraction, FakeMember, loaded
+
+suggest = import_module("plugins.@local.suggest.suggest")
+
+GUILD = 686214712354144387
+
+
+async def test_suggest_and_vote(bot, api):
+    guild = bot.add_guild(GUILD)
+    hotel = guild.add_channel()
+    author = FakeMember(guild, 1001, "guest")
+    async with loaded(suggest.Suggest(bot)) as cog:
+        cog.routes[guild.id] = {"hotel": hotel.id}
+        ctx = FakeContext(api, author, guild.add_channel())
+
+        # The category prompt, then the suggestion is posted and the prompt edited in the response
+        await api.measure(cog.suggest(ctx, suggestion="Add cars so guests can be driven to their rooms"))
+        assert api.names() == ["channel.send"]
+        view = api.last("channel.send")["view"]
+        view.category_select._values = ["hotel"]
+        round_trips = await api.measure(view.category_select.callback(FakeInteraction(api, author, view.message)))
+        assert api.names() == ["channel.send", "interaction.edit_message"]
+        assert api.calls[0][1]["channel"] == hotel.id
+        assert round_trips < 2.5
+
+        # A vote updates the counts in the response itself
+        tally = next(iter(cog.tallies.values()))
+        voter = FakeMember(guild, 1002, "voter")
+        approve = bot.views[0].children[0]
+        round_trips = await api.measure(approve.callback(FakeInteraction(api, voter, hotel.get_partial_message(tally.message_id))))
+        assert api.names() == ["interaction.edit_message"]
+        assert api.calls[0][1]["view"].children[0].label == "1"
+        assert round_trips < 1.5
+
+        # Similar suggestions are found in memory, the prompt is still a single message
+        await api.measure(cog.suggest(ctx, suggestion="Add cars to drive guests to their rooms"))
+        assert api.names() == ["channel.send"]
+        assert "Similar suggestions" in api.calls[0][1]["embed"].description
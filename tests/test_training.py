@@ -0,0 +1,110 @@
+import asyncio
+from importlib import import_module
+
+from fakes import FakeContext, FakeInteraction, FakeMember, loaded
+
+training = import_module("plugins.@local.training.training")
+
+HOME_GUILD = 686214712354144387
+OTHER_GUILD = 814758983238942720
+
+
+def training_session(cog):
+    return next(doc for doc in cog.coll.docs.values() if str(doc["_id"]).startswith("session:"))
+
+
+async def test_training_schedule_start_lock_end(bot, api):
+    home = bot.add_guild(HOME_GUILD)
+    home.add_channel(training.channel_id)
+    other = bot.add_guild(OTHER_GUILD)
+    host = FakeMember(home, 1001, "host", roles=[training.ALLOWED_ROLES[0]])
+    async with loaded(training.TrainingManager(bot)) as cog:
+        cog.training_channel_ids[other.id] = other.add_channel().id
+        ctx = FakeContext(api, host, home.add_channel())
+
+        # Schedule: the time select, then picking a time acknowledges it, disables it and asks to confirm
+        await api.measure(cog.training(ctx))
+        assert api.names() == ["channel.send"]
+        prompt = api.last("channel.send")
+        select = prompt["view"].children[0]
+        select._values = [select.options[0].value]
+        round_trips = await api.measure(select.callback(FakeInteraction(api, host, ctx.channel.get_partial_message(1))))
+        assert api.names() == ["interaction.defer", "message.edit", "interaction.followup"]
+        assert round_trips < 3.5
+
+        # Confirming answers, announces in every guild at once, confirms in chat and disables the buttons
+        confirm = api.last("interaction.followup")["view"].children[0]
+        round_trips = await api.measure(confirm.callback(FakeInteraction(api, host, ctx.channel.get_partial_message(2))))
+        assert api.names() == ["interaction.send_message", "channel.send", "channel.send", "channel.send", "message.edit"]
+        assert round_trips < 4.5
+        session = training_session(cog)
+        assert session["state"] == "scheduled" and len(session["copies"]) == 2
+
+        # Start and lock: an acknowledgement and one edit per copy, made at once. The clicks come
+        # further apart than the edit window, so every edit is the first of its window and goes out at once
+        announcement = bot.get_channel(session["channel_id"]).get_partial_message(session["message_id"])
+        for action, button in (("started", bot.views[0].start_button), ("locked", bot.views[0].lock_button)):
+            await asyncio.sleep(cog.edits.window)
+            round_trips = await api.measure(button.callback(FakeInteraction(api, host, announcement)))
+            assert api.names() == ["interaction.defer", "message.edit", "message.edit"]
+            assert round_trips < 2.5
+            assert training_session(cog)["state"] == action
+
+        # End: the same, then a single deferred deletion per copy
+        await asyncio.sleep(cog.edits.window)
+        round_trips = await api.measure(bot.views[0].end_button.callback(FakeInteraction(api, host, announcement)))
+        assert api.names() == ["interaction.defer", "message.edit", "message.edit"]
+        assert round_trips < 2.5
+        assert session["_id"] not in cog.coll.docs
+
+        round_trips = await api.measure(cog.deletions.delete_due(sorted(cog.deletions.heap)))
+        assert api.names() == ["message.delete"] * 2
+        assert round_trips < 1.5
+
+
+async def test_training_reminder(bot, api):
+    home = bot.add_guild(HOME_GUILD)
+    home.add_channel(training.channel_id)
+    host = FakeMember(home, 1001, "host", roles=[training.ALLOWED_ROLES[0]])
+    async with loaded(training.TrainingManager(bot)) as cog:
+        ctx = FakeContext(api, host, home.add_channel())
+        await cog.send_training_message(ctx, "9 AM EST / 2 PM GMT", 2 ** 31)
+        (_, session_id), = cog.timetable.slots
+
+        # A reminder is one reply under every copy of the announcement
+        await api.measure(cog.send_reminder(session_id, 0))
+        assert api.names() == ["channel.send"]
+        assert training_session(cog)["pings_sent"] == 1
+        assert training_session(cog)["expires_at"] == 2 ** 31 + training.TRAINING_TIMEOUT
+
+        # It was claimed before it was sent, so a process that had it booked as well doesn't send it again
+        await api.measure(cog.send_reminder(session_id, 0))
+        assert api.names() == []
+
+        # Started trainings get no more reminders
+        await cog.store.update(training_session(cog), {"state": "started"})
+        await api.measure(cog.send_reminder(session_id, 1))
+        assert api.names() == []
+
+
+async def test_training_slots_are_shared_between_processes(bot, api):
+    home = bot.add_guild(HOME_GUILD)
+    home.add_channel(training.channel_id)
+    host = FakeMember(home, 1001, "host", roles=[training.ALLOWED_ROLES[0]])
+    # Two bot processes on the same plugin database
+    async with loaded(training.TrainingManager(bot)) as first, loaded(training.TrainingManager(bot)) as second:
+        start = 2 ** 31 // training.TRAINING_LENGTH * training.TRAINING_LENGTH
+        await first.send_training_message(FakeContext(api, host, home.add_channel()), "9 AM EST / 2 PM GMT", start)
+
+        # The second process never booked it, but still sees the slot taken and lists the training
+        ctx = FakeContext(api, host, home.add_channel())
+        await api.measure(second.send_training_message(ctx, "9 AM EST / 2 PM GMT", start))
+        assert api.names() == ["channel.send"]
+        assert "already booked" in api.last("channel.send")["content"]
+        await api.measure(second.upcoming(ctx))
+        assert f"<t:{start}:F>" in api.last("channel.send")["embed"].description
+
+        # Ending the training frees the slot again
+        await first.end_training(training_session(first))
+        await second.send_training_message(ctx, "9 AM EST / 2 PM GMT", start)
+        assert len(second.timetable.slots) == 1
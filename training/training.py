@@ -1,11 +1,18 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from datetime import datetime, timedelta, timezone
 import asyncio
+import heapq
+import time
+from bisect import bisect_left, insort
+from importlib import import_module
 
 from core import checks
 from core.models import PermissionLevel
 
+# Helpers shared with the other plugins, from the "common" plugin installed next to this one
+common = import_module(f"..{__package__.rpartition('.')[2].replace('training', 'common', 1)}.common", __package__)
+
 ALLOWED_ROLES = [
     796317014209462332,
     686258158049558772,
@@ -21,6 +28,13 @@ MODIFY_ALLOWED = [
     686219247206137900
 ]
 
+# Capabilities resolved from a member's roles
+CAN_HOST = 1
+CAN_MODIFY = 2
+
+# Role names used by the trainingroles command
+ROLE_CAPABILITIES = {"host": CAN_HOST, "modify": CAN_MODIFY}
+
 ADMIN_USERS = [
     497582356064894997,
     349899849937846273
@@ -31,16 +45,191 @@ emoji = "<:cow:1012643349150314496>"
 channel_id = 741830399956877312
 ping_role_id = 695243187043696650
 
+# Trainings still running this many seconds after their scheduled start are ended automatically
+TRAINING_TIMEOUT = 21600  # 6 hours
+
+# Training slots offered by the training command, (label, hour in UTC)
+TIME_SLOTS = [
+    ("4 AM EST / 9 AM GMT", 9),
+    ("9 AM EST / 2 PM GMT", 14),
+    ("2 PM EST / 7 PM GMT", 19),
+    ("7 PM EST / 12 AM GMT", 0),
+    ("11 PM EST / 4 AM GMT", 4)
+]
+
+# Two trainings starting less than this many seconds apart conflict
+TRAINING_LENGTH = 3600
+
+# Reminder pings, in seconds before the training starts
+REMINDERS = (1800, 0)
+
+# Pings that are more than this many seconds late (the bot was down) are skipped
+PING_GRACE = 300
+
+
+def training_announcement(guild_id, color):
+    embed = discord.Embed(title="Training Session", color=0x57F287)
+    embed.add_field(name="Host", value="\u200b", inline=False)
+    embed.add_field(name="Scheduled Time", value="\u200b", inline=False)
+    embed.add_field(name="Session Status", value=f"Waiting for the host to start the training...", inline=False)
+    return embed
+
+
+class Timetable:
+    """
+    Trainings booked through this process sorted by start time, so conflicts are found with a binary search.
+    Reminder pings for every booking are sent from a single wakeup loop.
+    """
+
+    def __init__(self, bot, on_ping):
+        self.bot = bot
+        self.on_ping = on_ping
+        self.slots = []  # sorted (start, session id)
+        self.bookings = {}  # session id -> start
+        self.pings = []  # heap of (ping at, session id, reminder index)
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def conflict(self, start):
+        """Returns the session ID of a booking less than TRAINING_LENGTH away from start, if there is one."""
+        i = bisect_left(self.slots, (start - TRAINING_LENGTH + 1,))
+        if i < len(self.slots) and self.slots[i][0] < start + TRAINING_LENGTH:
+            return self.slots[i][1]
+        return None
+
+    def book(self, session_id, start, pings_sent=0):
+        if self.conflict(start) is not None:
+            return False
+        insort(self.slots, (start, session_id))
+        self.bookings[session_id] = start
+        for i in range(pings_sent, len(REMINDERS)):
+            heapq.heappush(self.pings, (start - REMINDERS[i], session_id, i))
+        self.wakeup.set()
+        return True
+
+    def cancel(self, session_id):
+        start = self.bookings.pop(session_id, None)
+        if start is not None:
+            del self.slots[bisect_left(self.slots, (start, session_id))]
+        # Pings of cancelled bookings are dropped when they come due
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            now = datetime.now(timezone.utc).timestamp()
+            if self.pings and self.pings[0][0] <= now:
+                ping_at, session_id, index = heapq.heappop(self.pings)
+                if session_id in self.bookings and now - ping_at <= PING_GRACE:
+                    try:
+                        await self.on_ping(session_id, index)
+                    except Exception as e:
+                        print(f"Failed to send the training reminder for {session_id}: {e}")
+                continue
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.pings[0][0] - now if self.pings else None)
+            except asyncio.TimeoutError:
+                pass
+
+def next_slot(hour, now):
+    """Returns the unix timestamp of the next time it is hour o'clock UTC."""
+    start = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if start <= now:
+        start += timedelta(days=1)
+    return int(start.timestamp())
+
+def slot_key(start):
+    """
+    Names the hour a training starting at start holds in the session store. Offered times are
+    whole hours, so two of them are less than TRAINING_LENGTH apart exactly when they share a key.
+    """
+    return f"slot:{start // TRAINING_LENGTH}"
+
+
+def session_copies(session):
+    # Sessions announced before trainings were sent to every guild only have one message
+    return [tuple(x) for x in session.get("copies", [(session["channel_id"], session["message_id"])])]
+
+class TrainingView(discord.ui.View):
+    """
+    Persistent view for every training message, sessions are looked up by message ID when clicked.
+    """
+
+    def __init__(self, cog, state="scheduled"):
+        super().__init__(timeout=None)
+        self.cog = cog
+        self.start_button.disabled = state != "scheduled"
+        self.lock_button.disabled = state != "started"
+        self.end_button.disabled = state == "scheduled"
+
+    @discord.ui.button(label="Start Training", style=discord.ButtonStyle.success, custom_id="training:start")
+    async def start_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.training_click(interaction, "start")
+
+    @discord.ui.button(label="Lock Training", style=discord.ButtonStyle.secondary, custom_id="training:lock")
+    async def lock_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.training_click(interaction, "lock")
+
+    @discord.ui.button(label="End Training", style=discord.ButtonStyle.danger, custom_id="training:end")
+    async def end_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.training_click(interaction, "end")
+
 class TrainingManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.coll = bot.plugin_db.get_partition(self)
+        self.permissions = common.PermissionResolver({CAN_HOST: ALLOWED_ROLES, CAN_MODIFY: MODIFY_ALLOWED})
         self.training_start_times = {}
         self.training_channel_ids = {}
         self.training_mention_roles = {}
+        self.fanout = common.FanOut()
+        self.cooldowns = common.cooldown_backend()
+        self.edits = common.EditCoalescer(self.fanout)
+        self.templates = common.EmbedTemplates()
+        self.templates.register("announcement", training_announcement)
+        self.deletions = common.DeletionScheduler(bot, self.coll)
+        self.store = common.session_backend(self.coll, "training")
+        self.timetable = Timetable(bot, self.send_reminder)
+
+    async def cog_load(self):
+        await self.store.create_indexes()
+        async for doc in self.coll.find({"roles": {"$exists": True}}):
+            for name, roles in doc["roles"].items():
+                self.permissions.set_roles(doc["guild_id"], ROLE_CAPABILITIES[name], roles)
+        async for doc in self.coll.find({"config": {"$exists": True}}):
+            if "channel_id" in doc["config"]:
+                self.training_channel_ids[doc["guild_id"]] = doc["config"]["channel_id"]
+            if "mention_role_id" in doc["config"]:
+                self.training_mention_roles[doc["guild_id"]] = doc["config"]["mention_role_id"]
+        self.bot.add_view(TrainingView(self))
+        for doc in await self.store.all():
+            if "scheduled_at" in doc:
+                self.timetable.book(doc["message_id"], doc["scheduled_at"], doc.get("pings_sent", 0))
+        self.expire_trainings.start()
+        await self.deletions.start()
+        self.timetable.start()
+
+    async def cog_unload(self):
+        self.expire_trainings.cancel()
+        self.deletions.stop()
+        self.timetable.stop()
+        self.cooldowns.close()
+        self.store.close()
+
+    def session_view(self, state):
+        return common.render_only(TrainingView(self, state))
 
     def is_allowed_role():
         async def predicate(ctx):
-            return any(role.id in ALLOWED_ROLES for role in ctx.author.roles)
+            return bool(ctx.cog.permissions.capabilities(ctx.author) & CAN_HOST)
         return commands.check(predicate)
 
     def is_admin_user():
@@ -48,6 +237,15 @@ class TrainingManager(commands.Cog):
             return ctx.author.id in ADMIN_USERS
         return commands.check(predicate)
 
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.permissions.invalidate(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.permissions.invalidate(role.guild.id)
+
     @commands.Cog.listener()
     async def on_ready(self):
         print(f'Logged in as {self.bot.user}!')
@@ -55,17 +253,20 @@ class TrainingManager(commands.Cog):
     @commands.command(aliases=["train"])
     @is_allowed_role()
     @checks.has_permissions(PermissionLevel.REGULAR)
-    @commands.cooldown(1, 3600, commands.BucketType.user)
+    @common.shared_cooldown(3600)
     async def training(self, ctx):
-        time_options = [
-            "4 AM EST / 9 AM GMT",
-            "9 AM EST / 2 PM GMT",
-            "2 PM EST / 7 PM GMT",
-            "7 PM EST / 12 AM GMT",
-            "11 PM EST / 4 AM GMT"
-        ]
-
-        select = discord.ui.Select(placeholder="Select a time...", options=[discord.SelectOption(label=time) for time in time_options])
+        now = datetime.now(timezone.utc)
+        time_options = sorted((next_slot(hour, now), label) for label, hour in TIME_SLOTS)
+        # Read from the store, so trainings booked through other bot processes show up too
+        booked = [doc["scheduled_at"] for doc in await self.store.upcoming(int(now.timestamp()) - TRAINING_LENGTH + 1, limit=25)]
+        options = []
+        for start, label in time_options:
+            description = datetime.fromtimestamp(start, timezone.utc).strftime("%A %d %B")
+            if any(abs(start - x) < TRAINING_LENGTH for x in booked):
+                description += " | Already booked"
+            options.append(discord.SelectOption(label=label, value=str(start), description=description))
+
+        select = discord.ui.Select(placeholder="Select a time...", options=options)
 
         async def select_callback(interaction):
             if interaction.user != ctx.author:
@@ -73,13 +274,14 @@ class TrainingManager(commands.Cog):
                 return
             
             select.disabled = True
-            selected_time = select.values[0]
+            start = int(select.values[0])
+            selected_time = dict(time_options)[start]
             await interaction.response.defer()  # Acknowledge the interaction
             await interaction.message.edit(view=view)
             
             confirm_embed = discord.Embed(
                 title="Confirm Training Time",
-                description=f"Would you like to post the training message for **{selected_time}**?",
+                description=f"Would you like to post the training message for **{selected_time}** (<t:{start}:F>)?",
                 color=0x57F287
             )
             confirm_view = discord.ui.View(timeout=60)  # Timeout after 60 seconds
@@ -90,8 +292,11 @@ class TrainingManager(commands.Cog):
                 if interaction.user != ctx.author:
                     await interaction.response.send_message("You are not authorized to confirm this action.", ephemeral=True)
                     return
+                if self.timetable.conflict(start) is not None:
+                    await interaction.response.send_message(f"{emoji} | Another training is already booked around that time.", ephemeral=True)
+                    return
                 await interaction.response.send_message(f"{emoji} | Training message will be sent!", ephemeral=True)
-                await self.send_training_message(ctx, selected_time)
+                await self.send_training_message(ctx, selected_time, start)
                 confirm_button.disabled = True
                 cancel_button.disabled = True
                 await interaction.message.edit(view=confirm_view)  # Update message to disable buttons
@@ -123,89 +328,198 @@ class TrainingManager(commands.Cog):
         view.add_item(select)
         await ctx.send("Select a training time:", view=view)
 
-    async def send_training_message(self, ctx, selected_time):
-        #training_channel_id = self.training_channel_ids.get(ctx.guild.id, channel_id)
-        #role_id = self.training_mention_roles.get(ctx.guild.id, ping_role_id)
-        session_ping = f"<@&{ping_role_id}>"
+    def announcement_targets(self):
+        """Returns (channel, mention role id) for every guild trainings are announced in."""
+        targets = {}
+        default = self.bot.get_channel(channel_id)
+        if default:
+            targets[default.guild.id] = (default, self.training_mention_roles.get(default.guild.id, ping_role_id))
+        for guild_id, training_channel_id in self.training_channel_ids.items():
+            channel = self.bot.get_channel(training_channel_id)
+            if channel:
+                targets[guild_id] = (channel, self.training_mention_roles.get(guild_id, targets.get(guild_id, (None, None))[1]))
+        return list(targets.values())
+
+    async def edit_copies(self, session, **fields):
+        """Edits every copy of a training announcement at once, returns the copies that were edited."""
+        copies = [(training_channel_id, message_id) for training_channel_id, message_id in session_copies(session) if self.bot.get_channel(training_channel_id)]
+        # Start, lock and end clicks in quick succession are merged into one edit per copy
+        results = await asyncio.gather(*(
+            self.edits.edit(self.bot.get_channel(training_channel_id).get_partial_message(message_id), **fields)
+            for training_channel_id, message_id in copies
+        ), return_exceptions=True)
+        edited = []
+        for copy, result in zip(copies, results):
+            if isinstance(result, discord.NotFound):
+                print("The training message was not found.")
+            elif isinstance(result, Exception):
+                print(f"An error occurred while trying to edit the training message: {result}")
+            else:
+                edited.append(copy)
+        return edited
+
+    async def send_training_message(self, ctx, selected_time, start):
         host_mention = ctx.author.mention
 
-        
-
-        embed = discord.Embed(
-            title="Training Session",
-            description=f"A training is being hosted at **{selected_time}**! Join the Training Center for a possible promotion. Trainees up to Junior Staff may attend to get promotion, while Senior Staff and above may assist.",
-            color=0x57F287
+        embed = self.templates.get(
+            "announcement",
+            values={0: host_mention, 1: f"{selected_time} (<t:{start}:F>, <t:{start}:R>)"},
+            description=f"A training is being hosted at **{selected_time}**! Join the Training Center for a possible promotion. Trainees up to Junior Staff may attend to get promotion, while Senior Staff and above may assist."
         )
-        embed.add_field(name="Host", value=host_mention, inline=False)
-        embed.add_field(name="Scheduled Time", value=selected_time, inline=False)
-        embed.add_field(name="Session Status", value=f"Waiting for the host to start the training...", inline=False)
         embed.set_footer(text=f"Scheduled by: {ctx.author.name}")
 
-        channel = self.bot.get_channel(channel_id)
-        if channel:
-            start_button = discord.ui.Button(label="Start Training", style=discord.ButtonStyle.success)
-            lock_button = discord.ui.Button(label="Lock Training", style=discord.ButtonStyle.secondary, disabled=True)
-            end_button = discord.ui.Button(label="End Training", style=discord.ButtonStyle.danger, disabled=True)
+        targets = self.announcement_targets()
+        if not targets:
+            await ctx.send("The specified channel could not be found.")
+            return
 
-            view = discord.ui.View(timeout=108000)  # 3 hours timeout
-            view.add_item(start_button)
-            view.add_item(lock_button)
-            view.add_item(end_button)
+        # The slot is claimed in the store before anything is sent, so a second host confirming
+        # the same slot meanwhile, through this or any other bot process, sees the conflict.
+        slot = slot_key(start)
+        if not await self.store.claim_slot(slot, start + TRAINING_TIMEOUT):
+            await ctx.send(f"{emoji} | Another training is already booked around <t:{start}:t>.")
+            return
 
-            msg = await channel.send(f"{session_ping}", embed=embed, view=view)
+        # Send the training announcement to every guild at once
+        view = self.session_view("scheduled")
+        results = await self.fanout.gather([
+            (channel.id, lambda channel=channel, role_id=role_id: channel.send(f"<@&{role_id}>" if role_id else None, embed=embed, view=view))
+            for channel, role_id in targets
+        ])
+        copies = [(msg.channel.id, msg.id) for msg in results if isinstance(msg, discord.Message)]
+        failed = [(channel, e) for (channel, _), e in zip(targets, results) if isinstance(e, Exception)]
+        for channel, e in failed:
+            print(f"Failed to announce the training in {channel.id}: {e}")
+        if not copies:
+            await self.store.release_slot(slot)
+            await ctx.send("The training announcement could not be sent.")
+            return
 
-            async def start_callback(interaction: discord.Interaction):
-                if not any(role.id in MODIFY_ALLOWED for role in interaction.user.roles) and interaction.user.id != ctx.author.id:
-                    await interaction.response.send_message("You do not have permission to start the training.", ephemeral=True)
-                    return
+        first_channel_id, first_message_id = copies[0]
+        self.timetable.book(first_message_id, start)
+        await self.store.insert({
+            "_id": f"session:{first_message_id}",
+            "guild_id": ctx.guild.id,
+            "channel_id": first_channel_id,
+            "message_id": first_message_id,
+            "copies": copies,
+            "message_ids": [message_id for _, message_id in copies],
+            "host_id": ctx.author.id,
+            "host_name": ctx.author.name,
+            "state": "scheduled",
+            "scheduled_at": start,
+            "embed": embed.to_dict(),
+            "expires_at": start + TRAINING_TIMEOUT
+        })
+
+        text = "Training session scheduled!"
+        if len(targets) > 1:
+            text += f" Announced in {len(copies)}/{len(targets)} servers."
+        if failed:
+            text += "\n" + "\n".join(f"Couldn't announce in {channel.mention}: {e}" for channel, e in failed)
+        await ctx.send(text)
+
+    async def training_click(self, interaction: discord.Interaction, action):
+        message_id = interaction.message.id
+        session = await self.store.find(message_id)
+        if session is None:
+            await interaction.response.send_message("This training has already ended.", ephemeral=True)
+            return
+        if not self.permissions.capabilities(interaction.user) & CAN_MODIFY and interaction.user.id != session["host_id"]:
+            await interaction.response.send_message(f"You do not have permission to {action} the training.", ephemeral=True)
+            return
 
-                start_time_unix = int(datetime.now(timezone.utc).timestamp())
-                embed.set_field_at(2, name="Session Status", value=f"Started <t:{start_time_unix}:R>")  # Update session status
-                start_button.disabled = True
-                end_button.disabled = False
-                lock_button.disabled = False
-                embed.color = self.bot.main_color
-                embed.set_footer(text=f"Started by: {ctx.author.name} | {embed.footer.text}")
-                await msg.edit(embed=embed, view=view)
-                await interaction.response.defer()  # Acknowledge the interaction
-
-            async def lock_callback(interaction: discord.Interaction):
-                if not any(role.id in MODIFY_ALLOWED for role in interaction.user.roles) and interaction.user.id != ctx.author.id:
-                    await interaction.response.send_message("You do not have permission to lock the training.", ephemeral=True)
-                    return
+        await interaction.response.defer()  # Acknowledge the interaction
+        if action == "end":
+            await self.end_training(session, automatic=False, ended_by=interaction.user)
+            return
 
-                lock_time_unix = int(datetime.now(timezone.utc).timestamp())
-                embed.set_footer(text=f"Locked by: {ctx.author.name} | {embed.footer.text}")
-                embed.title = "🔒 | Training Locked"
-                embed.color = 0xFFA500
-                embed.set_field_at(2, name="Session Status", value=f"Locked <t:{lock_time_unix}:R>")  # Update session status
-                lock_button.disabled = True
-                await msg.edit(embed=embed, view=view)
-                await interaction.response.defer()  # Acknowledge the interaction
-
-            async def end_callback(interaction: discord.Interaction):
-                if not any(role.id in MODIFY_ALLOWED for role in interaction.user.roles) and interaction.user.id != ctx.author.id:
-                    await interaction.response.send_message("You do not have permission to end the training.", ephemeral=True)
-                    return
-            
-                try:
-                    await self.end_training(msg, embed, ctx.author.name, automatic=False)
-                    await interaction.response.defer()  # Acknowledge the interaction
-                except discord.NotFound:
-                    print("The interaction was not found. It may have expired.")
-
-                
-            start_button.callback = start_callback
-            lock_button.callback = lock_callback
-            end_button.callback = end_callback
-
-            view.on_timeout = lambda: asyncio.create_task(self.end_training(msg, embed, "The training session has timed out due to inactivity.", automatic=True))
-            await ctx.send("Training session scheduled!")
+        while True:
+            change = self.session_change(session, action)
+            if change is None:
+                return
+            embed, update = change
+            if await self.store.update(session, update) is not None:
+                break
+            # Another click or process changed the session first, check the action against its new state
+            session = await self.store.get(session["_id"])
+            if session is None:
+                return
+        await self.edit_copies(session, embed=embed, view=self.session_view(update["state"]))
+
+    def session_change(self, session, action):
+        """Returns the (embed, fields) a start or lock click changes, or None if the session is in the wrong state for it."""
+        embed = discord.Embed.from_dict(session["embed"])
+        now_unix = int(datetime.now(timezone.utc).timestamp())
+        if action == "start":
+            if session["state"] != "scheduled":
+                return None
+            embed.set_field_at(2, name="Session Status", value=f"Started <t:{now_unix}:R>")  # Update session status
+            embed.color = self.bot.main_color
+            embed.set_footer(text=f"Started by: {session['host_name']} | {embed.footer.text}")
+            return embed, {"state": "started", "started_at": now_unix, "embed": embed.to_dict()}
+        if session["state"] != "started":
+            return None
+        embed.set_footer(text=f"Locked by: {session['host_name']} | {embed.footer.text}")
+        embed.title = "🔒 | Training Locked"
+        embed.color = 0xFFA500
+        embed.set_field_at(2, name="Session Status", value=f"Locked <t:{now_unix}:R>")  # Update session status
+        return embed, {"state": "locked", "embed": embed.to_dict()}
+
+    async def send_reminder(self, session_id, index):
+        """Pings the mention role under every copy of the announcement, called by the timetable."""
+        session = await self.store.get(f"session:{session_id}")
+        # The reminder is claimed before it is sent, so when several bot processes have the training
+        # booked only the one whose update lands pings. Started trainings get no more reminders.
+        while session is not None and session["state"] == "scheduled" and session.get("pings_sent", 0) <= index:
+            if await self.store.update(session, {"pings_sent": index + 1}) is not None:
+                break
+            session = await self.store.get(session["_id"])
         else:
-            await ctx.send("The specified channel could not be found.")
+            return
+        start = session["scheduled_at"]
+        roles = {channel.id: role_id for channel, role_id in self.announcement_targets()}
+        copies = [(training_channel_id, message_id) for training_channel_id, message_id in session_copies(session) if self.bot.get_channel(training_channel_id)]
+        text = f"The training hosted by {session['host_name']} starts <t:{start}:R>!"
+        results = await self.fanout.gather([
+            (training_channel_id, lambda channel=self.bot.get_channel(training_channel_id), message_id=message_id: channel.send(
+                f"<@&{roles[channel.id]}> {text}" if roles.get(channel.id) else text,
+                reference=channel.get_partial_message(message_id),
+                mention_author=False
+            ))
+            for training_channel_id, message_id in copies
+        ])
+        for msg in results:
+            if isinstance(msg, discord.Message):
+                await self.deletions.schedule(msg.channel.id, msg.id, start + TRAINING_LENGTH)
+            else:
+                print(f"Failed to send a training reminder: {msg}")
+
+    @tasks.loop(minutes=1)
+    async def expire_trainings(self):
+        now = int(datetime.now(timezone.utc).timestamp())
+        for session in await self.store.expired(now):
+            await self.end_training(session, automatic=True)
+
+    @expire_trainings.before_loop
+    async def before_expire_trainings(self):
+        await self.bot.wait_until_ready()
+
+    async def end_training(self, session, automatic=False, ended_by=None):
+        # Removing the session first makes sure a training is only ended once
+        session = await self.store.delete(session["_id"])
+        if session is None:
+            return
+        self.timetable.cancel(session["message_id"])
+        await self.store.release_slot(slot_key(session["scheduled_at"]))
+        await common.record_history(
+            self.coll, session["message_id"], session["guild_id"], session["host_id"], session.get("started_at"),
+            int(datetime.now(timezone.utc).timestamp()), ended_by.id if ended_by else None
+        )
+
+        embed = discord.Embed.from_dict(session["embed"])
+        name = session["host_name"]
 
-    
-    async def end_training(self, msg, embed, name, automatic=False):
         delete_time_unix = int(datetime.now(timezone.utc).timestamp()) + 600  # 600 = 10 mins
         embed.title = "Training Ended"
         if automatic:
@@ -216,15 +530,53 @@ class TrainingManager(commands.Cog):
         embed.description = f"The training session hosted by {name} has just ended. We appreciate your presence and look forward to seeing you at future trainings\n\nDeleting this message <t:{delete_time_unix}:R>"
         embed.clear_fields()
         embed.color = 0xF04747
-        await msg.edit(embed=embed, view=None)
-        await asyncio.sleep(600)
-        await msg.delete()
+        for training_channel_id, message_id in await self.edit_copies(session, embed=embed, view=None):
+            await self.deletions.schedule(training_channel_id, message_id, delete_time_unix)
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.REGULAR)
+    async def trainingstats(self, ctx, member: discord.Member = None):
+        """
+        Show how many trainings were hosted in this server, or by a member, today, this week and in total.
+        """
+        subject = member.id if member else "guild"
+        total, today, week = await common.rollup_stats(self.coll, ctx.guild.id, subject)
+        embed = discord.Embed(
+            title=f"Training Stats | {member or ctx.guild.name}",
+            color=self.bot.main_color
+        )
+        for name, doc in (("Today", today), ("This Week", week), ("All Time", total)):
+            embed.add_field(name=name, value=f"{doc.get('count', 0)} trainings | {common.format_duration(doc.get('seconds', 0))}", inline=False)
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.REGULAR)
+    async def upcoming(self, ctx):
+        """
+        Show the next booked trainings.
+        """
+        # Read from the store, so trainings booked through other bot processes are listed too
+        sessions = await self.store.upcoming(int(datetime.now(timezone.utc).timestamp()))
+        if not sessions:
+            return await ctx.send(f"{emoji} | No trainings are booked.")
+        lines = []
+        for session in sessions:
+            start = session["scheduled_at"]
+            link = f"https://discord.com/channels/{session['guild_id']}/{session['channel_id']}/{session['message_id']}"
+            lines.append(f"<t:{start}:F> (<t:{start}:R>) | Hosted by <@{session['host_id']}> | [Jump]({link})")
+        embed = discord.Embed(title="Upcoming Trainings", description="\n".join(lines), color=self.bot.main_color)
+        await ctx.send(embed=embed)
 
     @commands.command()
     @checks.has_permissions(PermissionLevel.OWNER)
     @is_admin_user()
     async def trainingmention(self, ctx, role: discord.Role):
         self.training_mention_roles[ctx.guild.id] = role.id
+        await self.coll.update_one(
+            {"_id": f"config:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, "config.mention_role_id": role.id}},
+            upsert=True
+        )
         await ctx.send(f"Training mention role set to {role.mention}.")
 
     @commands.command()
@@ -232,8 +584,31 @@ class TrainingManager(commands.Cog):
     @is_admin_user()
     async def trainingchannel(self, ctx, channel: discord.TextChannel):
         self.training_channel_ids[ctx.guild.id] = channel.id
+        await self.coll.update_one(
+            {"_id": f"config:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, "config.channel_id": channel.id}},
+            upsert=True
+        )
         await ctx.send(f"Training messages will now be sent in {channel.mention}.")
 
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.OWNER)
+    @is_admin_user()
+    async def trainingroles(self, ctx, name: str.lower, roles: commands.Greedy[discord.Role]):
+        """
+        Set the roles that can host (`host`) or start, lock and end (`modify`) trainings in this server.
+        """
+        if name not in ROLE_CAPABILITIES:
+            return await ctx.send(f"{emoji} | The role list has to be `host` or `modify`.")
+        role_ids = [role.id for role in roles]
+        self.permissions.set_roles(ctx.guild.id, ROLE_CAPABILITIES[name], role_ids)
+        await self.coll.update_one(
+            {"_id": f"roles:{ctx.guild.id}"},
+            {"$set": {"guild_id": ctx.guild.id, f"roles.{name}": role_ids}},
+            upsert=True
+        )
+        await ctx.send(f"{emoji} | {name.capitalize()} roles set to {', '.join(role.mention for role in roles) or 'nobody'}.")
+
     @commands.command()
     @checks.has_permissions(PermissionLevel.OWNER)
     @is_admin_user()
@@ -246,12 +621,63 @@ class TrainingManager(commands.Cog):
     Training Start Times: {self.training_start_times}
     Training Channel IDs: {self.training_channel_ids}
     Training Mention Roles: {self.training_mention_roles}
-    Allowed Roles: {ALLOWED_ROLES}
+    Allowed Roles: {sorted(self.permissions.roles_for(ctx.guild.id)[CAN_HOST])}
+    Modify Roles: {sorted(self.permissions.roles_for(ctx.guild.id)[CAN_MODIFY])}
     Admin Users: {ADMIN_USERS}
     ```"""
         
         await ctx.send(config_info)
 
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.OWNER)
+    @is_admin_user()
+    async def trainingdeletes(self, ctx):
+        """
+        List the training messages waiting to be deleted.
+        """
+        if not self.deletions.heap:
+            return await ctx.send(f"{emoji} | No training messages are waiting to be deleted.")
+        jobs = sorted(self.deletions.heap)[:20]
+        lines = [f"<#{channel}> `{message}` <t:{int(delete_at)}:R>" for delete_at, channel, message in jobs]
+        await ctx.send(f"**{len(self.deletions.heap)} pending deletions**\n" + "\n".join(lines))
+
+    @commands.command()
+    @checks.has_permissions(PermissionLevel.OWNER)
+    @is_admin_user()
+    async def sessionbench(self, ctx, workers: int = 8, rounds: int = 50):
+        """
+        Measure session updates per second while `workers` clicks race on the same session.
+        """
+        session_id = f"bench:{ctx.message.id}"
+        await self.store.insert({"_id": session_id, "message_id": ctx.message.id, "counter": 0, "expires_at": 2 ** 31})
+        # Every worker has a connection of its own, like separate bot processes, so their reads
+        # and writes run at the same time and race for the same version
+        stores = [self.store.fork() for _ in range(workers)]
+        conflicts = 0
+
+        async def worker(store):
+            nonlocal conflicts
+            for _ in range(rounds):
+                while True:
+                    doc = await store.get(session_id)
+                    if await store.update(doc, {"counter": doc["counter"] + 1}) is not None:
+                        break
+                    conflicts += 1
+
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(worker(store) for store in stores))
+            elapsed = time.perf_counter() - start
+        finally:
+            for store in stores:
+                if store is not self.store:
+                    store.close()
+            doc = await self.store.delete(session_id)
+        await ctx.send(
+            f"**{type(self.store).__name__}**: {workers * rounds / elapsed:.0f} updates/s with {workers} workers, "
+            f"{conflicts} version conflicts retried, counter {doc['counter']}/{workers * rounds}"
+        )
+
     @training.error
     async def training_error(self, ctx, error):
         if isinstance(error, commands.CommandOnCooldown):